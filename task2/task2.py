@@ -8,6 +8,7 @@ import pandas as pd
 from datetime import datetime, timezone
 from collections import defaultdict
 import zipfile
+import hashlib
 
 
 # Setup logging
@@ -33,11 +34,88 @@ def parse_arguments():
     parser.add_argument('--filename', type=str, default='output', help='Name of the output file (default: output)')
     parser.add_argument('--gender', type=str, choices=['male', 'female'], help='Filter data by gender')
     parser.add_argument('--num_rows', type=int, help='Number of rows to filter by')
+    parser.add_argument('--compact', action='store_true', help='Load data with the compact dtype schema to save memory')
+    parser.add_argument('--drop_columns', nargs='+', default=[], help='Columns to skip at parse time in compact mode')
+    parser.add_argument('--refresh', action='store_true', help='Ignore the stage cache and re-run every stage')
     parser.add_argument('log_level', nargs='?', default='INFO', help='Log level (default: INFO)')
 
     return parser.parse_args()
 
 
+# Stage cache: every stage stores a hash of its inputs and parameters in the manifest
+CACHE_DIR = '.task2_cache'
+MANIFEST_PATH = os.path.join(CACHE_DIR, 'manifest.json')
+
+
+def load_manifest():
+    if not os.path.exists(MANIFEST_PATH):
+        return {'stages': {}, 'partitions': {}}
+    with open(MANIFEST_PATH, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def save_manifest(manifest):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = f"{MANIFEST_PATH}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+
+def stage_key(stage, params, input_files=()):
+    digest = hashlib.sha256()
+    digest.update(json.dumps([stage, params], sort_keys=True, default=str).encode('utf-8'))
+    for path in input_files:
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def stage_is_fresh(manifest, stage, key, outputs):
+    return manifest['stages'].get(stage) == key and all(os.path.exists(path) for path in outputs)
+
+
+# Compact memory mode: explicit dtypes for the randomuser CSV columns.
+# Only lossless conversions are used so the written files stay byte-identical.
+CATEGORY_COLUMNS = ['gender', 'name.title', 'location.country', 'location.state', 'location.timezone.offset',
+                    'location.timezone.description', 'id.name', 'nat']
+FLOAT_COLUMNS = ['location.coordinates.latitude', 'location.coordinates.longitude']
+INTEGER_COLUMNS = ['location.street.number', 'dob.age', 'registered.age']
+
+
+def read_users_csv(path, compact=False, drop_columns=()):
+    if not compact:
+        return pd.read_csv(path, encoding='utf-8')
+
+    header = pd.read_csv(path, encoding='utf-8', nrows=0).columns
+    usecols = [column for column in header if column not in drop_columns]
+    dtype = {column: 'category' for column in CATEGORY_COLUMNS if column in usecols}
+    dtype.update({column: 'float64' for column in FLOAT_COLUMNS if column in usecols})
+    df = pd.read_csv(path, encoding='utf-8', usecols=usecols, dtype=dtype)
+
+    # Integer columns without gaps are parsed as int64; shrink them to the smallest type that fits
+    for column in INTEGER_COLUMNS:
+        if column in df.columns and pd.api.types.is_integer_dtype(df[column]):
+            df[column] = pd.to_numeric(df[column], downcast='integer')
+
+    report_memory(df, path)
+    return df
+
+
+# The "instead of" size is an estimate: the compact frame cast back to object and int64 columns, not a default
+# read_csv of the file (that would load it twice), and it leaves out the dropped columns
+def report_memory(df, label):
+    compact_bytes = df.memory_usage(deep=True).sum()
+    generic = df.astype({column: object for column in df.select_dtypes('category').columns})
+    generic = generic.astype({column: 'int64' for column in generic.select_dtypes('integer').columns})
+    generic_bytes = generic.memory_usage(deep=True).sum()
+    saved = generic_bytes - compact_bytes
+    logger.info(f"Compact load of {label}: {compact_bytes / 1024:.1f} KiB instead of an estimated "
+                f"{generic_bytes / 1024:.1f} KiB for the loaded columns with generic dtypes "
+                f"(~{saved / 1024:.1f} KiB, ~{saved / max(generic_bytes, 1):.0%} saved)")
+
+
 # Download user data from RandomUser API
 def download_user_data(num_rows=5000):
     url = f'https://randomuser.me/api/?results={num_rows}&format=csv'
@@ -50,8 +128,8 @@ def download_user_data(num_rows=5000):
 
 
 # Process user data
-def process_data(gender=None, num_rows=None):
-    df = pd.read_csv('users.csv', encoding='utf-8')
+def process_data(gender=None, num_rows=None, compact=False, drop_columns=()):
+    df = read_users_csv('users.csv', compact, drop_columns)
     logger.info(f"Read users.csv with {len(df)} records")
 
     if gender:
@@ -67,7 +145,10 @@ def process_data(gender=None, num_rows=None):
     df['current_time'] = df.apply(lambda row: datetime.now(timezone.utc).astimezone().isoformat(), axis=1)
 
     title_map = {'Mrs': 'missis', 'Ms': 'miss', 'Mr': 'mister', 'Madame': 'mademoiselle'}
-    df['name.title'] = df['name.title'].map(title_map).fillna(df['name.title'])
+    if isinstance(df['name.title'].dtype, pd.CategoricalDtype):
+        df['name.title'] = df['name.title'].cat.rename_categories(lambda title: title_map.get(title, title))
+    else:
+        df['name.title'] = df['name.title'].map(title_map).fillna(df['name.title'])
 
     df['dob.date'] = pd.to_datetime(df['dob.date']).dt.strftime('%m/%d/%Y')
     df['registered.date'] = pd.to_datetime(df['registered.date']).dt.strftime('%m-%d-%Y, %H:%M:%S')
@@ -78,8 +159,10 @@ def process_data(gender=None, num_rows=None):
 
 
 # Create directory structure and save data
-def create_directory_structure(destination_folder):
-    df = pd.read_csv('processed_users.csv')
+# Only groups whose rows changed since the cached run are written again.
+def create_directory_structure(destination_folder, cached_partitions=None, compact=False):
+    df = read_users_csv('processed_users.csv', compact)
+    cached_partitions = cached_partitions or {}
 
     data_structure = defaultdict(lambda: defaultdict(list))
 
@@ -94,6 +177,8 @@ def create_directory_structure(destination_folder):
     if not os.path.exists(destination_folder):
         os.makedirs(destination_folder)
 
+    partitions = {}
+    changed_files = []
     for decade, countries in data_structure.items():
         decade_path = os.path.join(destination_folder, decade)
         os.makedirs(decade_path, exist_ok=True)
@@ -102,6 +187,20 @@ def create_directory_structure(destination_folder):
             country_path = os.path.join(decade_path, country)
             os.makedirs(country_path, exist_ok=True)
 
+            group = f"{decade}/{country}"
+            group_df = pd.DataFrame(users)
+            content = group_df.to_csv(index=False)
+            # current_time is stamped anew on every process run, so it is left out of the hash:
+            # a group whose users did not change keeps its cached file
+            group_hash = hashlib.sha256(
+                group_df.drop(columns=['current_time'], errors='ignore').to_csv(index=False).encode('utf-8')
+            ).hexdigest()
+            cached = cached_partitions.get(group)
+            if cached and cached['hash'] == group_hash and os.path.exists(os.path.join(destination_folder, cached['file'])):
+                partitions[group] = cached
+                logger.debug(f"Partition unchanged, skipped: {cached['file']}")
+                continue
+
             max_age = max([2024 - int(user['dob.date'].split('/')[-1]) for user in users])
             avg_registered_years = round(
                 sum([2024 - int(user['registered.date'].split(',')[0].split('-')[0]) for user in users]) / len(users),
@@ -111,10 +210,27 @@ def create_directory_structure(destination_folder):
 
             file_name = f"max_age_{max_age}_avg_registered_{avg_registered_years}_popular_id_{common_id_name}.csv"
             file_path = os.path.join(country_path, file_name)
+            relative_path = os.path.relpath(file_path, destination_folder)
+            partitions[group] = {'hash': group_hash, 'file': relative_path}
 
-            pd.DataFrame(users).to_csv(file_path, index=False)
+            with open(file_path, 'w', newline='', encoding='utf-8') as file:
+                file.write(content)
+            changed_files.append(relative_path)
             logger.info(f"Created file: {file_path}")
 
+    current_files = {partition['file'] for partition in partitions.values()}
+    removed_files = []
+    for partition in cached_partitions.values():
+        if partition['file'] in current_files:
+            continue
+        stale_path = os.path.join(destination_folder, partition['file'])
+        if os.path.exists(stale_path):
+            os.remove(stale_path)
+            logger.info(f"Removed stale file: {stale_path}")
+        removed_files.append(partition['file'])
+
+    return partitions, changed_files, removed_files
+
 
 # Log folder structure
 def log_folder_structure(destination_folder):
@@ -128,14 +244,28 @@ def log_folder_structure(destination_folder):
 
 
 # Archive destination folder
-def archive_folder(destination_folder):
+# With changed_files given, members of the previous archive are reused and only changed files are re-read from disk.
+def archive_folder(destination_folder, changed_files=None, removed_files=()):
     zip_filename = f"{destination_folder}.zip"
-    with zipfile.ZipFile(zip_filename, 'w') as zipf:
-        for root, _, files in os.walk(destination_folder):
-            for file in files:
-                file_path = os.path.join(root, file)
-                zipf.write(file_path, os.path.relpath(file_path, destination_folder))
-    logger.info(f"Archived folder: {zip_filename}")
+    if changed_files is None or not os.path.exists(zip_filename):
+        with zipfile.ZipFile(zip_filename, 'w') as zipf:
+            for root, _, files in os.walk(destination_folder):
+                for file in files:
+                    file_path = os.path.join(root, file)
+                    zipf.write(file_path, os.path.relpath(file_path, destination_folder))
+        logger.info(f"Archived folder: {zip_filename}")
+        return
+
+    replaced = {os.path.normpath(path) for path in changed_files} | {os.path.normpath(path) for path in removed_files}
+    tmp_filename = f"{zip_filename}.tmp"
+    with zipfile.ZipFile(zip_filename, 'r') as old_zip, zipfile.ZipFile(tmp_filename, 'w') as zipf:
+        for info in old_zip.infolist():
+            if os.path.normpath(info.filename) not in replaced:
+                zipf.writestr(info, old_zip.read(info))
+        for relative_path in changed_files:
+            zipf.write(os.path.join(destination_folder, relative_path), relative_path)
+    os.replace(tmp_filename, zip_filename)
+    logger.info(f"Updated archive {zip_filename}: {len(changed_files)} member(s) rewritten, {len(removed_files)} removed")
 
 
 if __name__ == "__main__":
@@ -144,20 +274,48 @@ if __name__ == "__main__":
 
     try:
         logger.info("Starting data preparation script.")
-        download_user_data()
-        logger.info("Downloaded user data.")
-
-        process_data(args.gender, args.num_rows)
-        logger.info("Processed user data.")
-
-        create_directory_structure(args.destination_folder)
-        logger.info("Created directory structure and saved data.")
-
-        log_folder_structure(args.destination_folder)
-        logger.info("Logged folder structure.")
-
-        archive_folder(args.destination_folder)
-        logger.info("Archived destination folder.")
+        manifest = {'stages': {}, 'partitions': {}} if args.refresh else load_manifest()
+
+        key = stage_key('download', {'num_rows': 5000})
+        if stage_is_fresh(manifest, 'download', key, ['users.csv']):
+            logger.info("Download stage unchanged, reusing users.csv.")
+        else:
+            download_user_data()
+            manifest['stages']['download'] = key
+            save_manifest(manifest)
+            logger.info("Downloaded user data.")
+
+        key = stage_key('process', {'gender': args.gender, 'num_rows': args.num_rows,
+                                    'drop_columns': sorted(args.drop_columns) if args.compact else []}, ['users.csv'])
+        if stage_is_fresh(manifest, 'process', key, ['processed_users.csv']):
+            logger.info("Process stage unchanged, reusing processed_users.csv.")
+        else:
+            process_data(args.gender, args.num_rows, args.compact, args.drop_columns)
+            manifest['stages']['process'] = key
+            save_manifest(manifest)
+            logger.info("Processed user data.")
+
+        destination = os.path.abspath(args.destination_folder)
+        key = stage_key('partition', {'destination': destination}, ['processed_users.csv'])
+        zip_filename = f"{args.destination_folder}.zip"
+        if stage_is_fresh(manifest, 'partition', key, [args.destination_folder, zip_filename]):
+            logger.info("Partition and archive stages unchanged, reusing outputs.")
+        else:
+            cached_partitions = manifest['partitions'].get(destination, {})
+            partitions, changed_files, removed_files = create_directory_structure(args.destination_folder,
+                                                                                  cached_partitions, args.compact)
+            logger.info(f"Created directory structure and saved data: {len(changed_files)} of "
+                        f"{len(partitions)} partition(s) rewritten.")
+
+            log_folder_structure(args.destination_folder)
+            logger.info("Logged folder structure.")
+
+            archive_folder(args.destination_folder, changed_files if cached_partitions else None, removed_files)
+            logger.info("Archived destination folder.")
+
+            manifest['partitions'][destination] = partitions
+            manifest['stages']['partition'] = key
+            save_manifest(manifest)
 
         logger.info("Data preparation script completed successfully.")
     except Exception as e:
@@ -0,0 +1,252 @@
+import os
+import sqlite3
+import logging
+import argparse
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from task3 import format_datetime
+
+logging.basicConfig(level=logging.INFO)
+
+ARCHIVE_HORIZON_DAYS = 365
+
+ARCHIVE_STATE_SQL = [
+    '''
+        CREATE TABLE IF NOT EXISTS Transaction_archive (
+            Month TEXT PRIMARY KEY,
+            Path TEXT NOT NULL,
+            Rows INTEGER NOT NULL,
+            First_datetime TEXT NOT NULL,
+            Last_datetime TEXT NOT NULL
+        )
+    ''',
+    '''
+        CREATE TABLE IF NOT EXISTS Transaction_archive_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            Cutoff TEXT NOT NULL
+        )
+    ''',
+]
+
+# Same columns as "Transaction", without the foreign keys: Account lives in the main database
+ARCHIVE_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS archive."Transaction" (
+        id INTEGER PRIMARY KEY,
+        Bank_sender_name TEXT NOT NULL,
+        Account_sender_id INTEGER NOT NULL,
+        Bank_receiver_name TEXT NOT NULL,
+        Account_receiver_id INTEGER NOT NULL,
+        Sent_Currency TEXT NOT NULL,
+        Sent_Amount INTEGER NOT NULL,
+        Datetime TEXT NOT NULL
+    )
+'''
+ARCHIVE_INDEX_SQL = ('CREATE INDEX IF NOT EXISTS archive.idx_transaction_sender '
+                     'ON "Transaction" (Account_sender_id, Datetime)')
+
+
+def month_start(dt):
+    return dt.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month(month):
+    year, month = int(month[:4]), int(month[5:7])
+    return f"{year + month // 12:04d}-{month % 12 + 1:02d}"
+
+
+def main_db_file(conn):
+    for _, name, path in conn.execute('PRAGMA database_list'):
+        if name == 'main':
+            return path
+
+
+def main_db_dir(conn):
+    return os.path.dirname(main_db_file(conn)) or os.getcwd()
+
+
+# Archive files are stored relative to the main database, so the database and its archive can be moved together
+def partition_path(archive_dir, month):
+    return os.path.join(archive_dir, f"transactions_{month.replace('-', '_')}.db")
+
+
+def archive_cutoff(conn):
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'Transaction_archive_state'").fetchone():
+        return None
+    row = conn.execute('SELECT Cutoff FROM Transaction_archive_state WHERE id = 1').fetchone()
+    return row[0] if row else None
+
+
+# Archived months holding transactions at or after `since` (all of them when since is None)
+def archived_partitions(conn, since=None):
+    cutoff = archive_cutoff(conn)
+    if cutoff is None or (since is not None and since >= cutoff):
+        return []
+    rows = conn.execute('SELECT Month, Path FROM Transaction_archive WHERE Last_datetime >= ? ORDER BY Month',
+                        (since or '',)).fetchall()
+    base_dir = main_db_dir(conn)
+    return [(month, os.path.join(base_dir, path)) for month, path in rows]
+
+
+# A copy of the database made elsewhere (a report snapshot) keeps reading the original's archive: its partition
+# paths are made absolute against the original's directory. Registered partitions only gain rows an archive run
+# moves out of the hot table, so the copy still sees each archived month once.
+def pin_archive_paths(conn, base_dir):
+    if archive_cutoff(conn) is None:
+        return
+    rows = conn.execute('SELECT Month, Path FROM Transaction_archive').fetchall()
+    conn.executemany('UPDATE Transaction_archive SET Path = ? WHERE Month = ?',
+                     [(os.path.join(base_dir, path), month) for month, path in rows])
+    conn.commit()
+
+
+# ATTACH cannot run inside a transaction, and committing the caller's work to get out of one is not ours to do
+def check_no_transaction(conn):
+    if conn.in_transaction:
+        raise RuntimeError("Archived transactions cannot be read inside an open transaction, commit or roll it back "
+                           "first")
+
+
+def attach_partition(conn, month, path):
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Archive partition {month} is missing: {path}")
+    alias = f"archive_{month.replace('-', '_')}"
+    # Still attached when an earlier read could not detach it (see detach_partitions)
+    if alias not in [name for _, name, _ in conn.execute('PRAGMA database_list')]:
+        check_no_transaction(conn)
+        conn.execute(f'ATTACH DATABASE ? AS {alias}', (path,))
+    return alias
+
+
+# A partition read in a transaction the caller opened meanwhile cannot be detached before it ends: it stays attached
+# and the next read that needs it reuses it
+def detach_partitions(conn, aliases):
+    if conn.in_transaction:
+        return
+    for alias in aliases:
+        conn.execute(f'DETACH DATABASE {alias}')
+
+
+# Attach the partitions a query from `since` needs and yield its FROM source: the hot table alone when the range is
+# not archived, otherwise a UNION ALL of the hot table and the attached partitions (filters are pushed into each arm)
+@contextmanager
+def transaction_source(conn, since=None):
+    aliases = []
+    try:
+        partitions = archived_partitions(conn, since)
+        if partitions:
+            check_no_transaction(conn)
+        for month, path in partitions:
+            aliases.append(attach_partition(conn, month, path))
+        if not aliases:
+            yield '"Transaction"'
+        else:
+            arms = ['SELECT * FROM main."Transaction"'] + [f'SELECT * FROM {alias}."Transaction"' for alias in aliases]
+            yield f'({" UNION ALL ".join(arms)}) AS "Transaction"'
+    finally:
+        detach_partitions(conn, aliases)
+
+
+# Yield the hot table, then each partition the range needs, attached one at a time so there is no ATTACH limit.
+# A caller writing between sources (e.g. into a temp table) has to end its own transaction before asking for the next.
+def each_transaction_source(conn, since=None):
+    partitions = archived_partitions(conn, since)
+    if partitions:
+        check_no_transaction(conn)
+    yield 'main."Transaction"'
+    for month, path in partitions:
+        alias = attach_partition(conn, month, path)
+        try:
+            yield f'{alias}."Transaction"'
+        finally:
+            detach_partitions(conn, [alias])
+
+
+# Move transactions older than the horizon into one archive file per month. The cutoff is always a month start.
+# SQLite commits a transaction over an attached database atomically only in rollback journal mode, not in WAL, so
+# each month moves in two transactions that each write a single file. The first copies the month into its partition
+# with INSERT OR IGNORE and commits. The second checks that every row of the month in the hot table is in the
+# partition, deletes them and records the partition and the cutoff (moved to the end of that month). A crash
+# between the two leaves the rows in both files with the cutoff unchanged, so queries still read them from the hot
+# table only, and a rerun copies nothing new and finishes the move.
+def archive_transactions(conn, horizon_days=ARCHIVE_HORIZON_DAYS, archive_dir=None, now=None):
+    now = now or datetime.now(timezone.utc)
+    cutoff = format_datetime(month_start(now - timedelta(days=horizon_days)))
+    archive_dir = archive_dir or f"{os.path.splitext(os.path.basename(main_db_file(conn)))[0]}_archive"
+    base_dir = main_db_dir(conn)
+    os.makedirs(os.path.join(base_dir, archive_dir), exist_ok=True)
+
+    for sql in ARCHIVE_STATE_SQL:
+        conn.execute(sql)
+    conn.commit()
+
+    months = [row[0] for row in conn.execute('SELECT DISTINCT substr(Datetime, 1, 7) FROM "Transaction" '
+                                             'WHERE Datetime < ? ORDER BY 1', (cutoff,))]
+    archived = {}
+    for month in months:
+        path = partition_path(archive_dir, month)
+        start, end = f"{month}-01 00:00:00", min(f"{next_month(month)}-01 00:00:00", cutoff)
+        conn.execute('ATTACH DATABASE ? AS archive', (os.path.join(base_dir, path),))
+        try:
+            conn.execute(ARCHIVE_TABLE_SQL)
+            conn.execute(ARCHIVE_INDEX_SQL)
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('INSERT OR IGNORE INTO archive."Transaction" SELECT * FROM main."Transaction" '
+                         'WHERE Datetime >= ? AND Datetime < ?', (start, end))
+            conn.commit()
+
+            conn.execute('BEGIN IMMEDIATE')
+            # Rows written to the hot table after the copy, or ids taken by other rows in the partition
+            missing = conn.execute('''
+                SELECT COUNT(*) FROM main."Transaction" AS t
+                WHERE t.Datetime >= ? AND t.Datetime < ?
+                    AND NOT EXISTS (SELECT 1 FROM archive."Transaction" AS a WHERE a.id = t.id
+                                    AND a.Datetime = t.Datetime AND a.Account_sender_id = t.Account_sender_id)
+            ''', (start, end)).fetchone()[0]
+            if missing:
+                raise RuntimeError(f"{missing} transactions of {month} are not in {path}, the month was not archived")
+            moved = conn.execute('DELETE FROM main."Transaction" WHERE Datetime >= ? AND Datetime < ?',
+                                 (start, end)).rowcount
+            first, last = conn.execute('SELECT MIN(Datetime), MAX(Datetime) FROM archive."Transaction"').fetchone()
+            rows = conn.execute('SELECT COUNT(*) FROM archive."Transaction"').fetchone()[0]
+            conn.execute('''
+                INSERT INTO Transaction_archive (Month, Path, Rows, First_datetime, Last_datetime)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (Month) DO UPDATE SET Path = excluded.Path, Rows = excluded.Rows,
+                    First_datetime = excluded.First_datetime, Last_datetime = excluded.Last_datetime
+            ''', (month, path, rows, first, last))
+            conn.execute('INSERT INTO Transaction_archive_state (id, Cutoff) VALUES (1, ?) '
+                         'ON CONFLICT (id) DO UPDATE SET Cutoff = max(Cutoff, excluded.Cutoff)', (end,))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.execute('DETACH DATABASE archive')
+        archived[month] = moved
+        logging.info(f"Archived {moved} transactions of {month} to {path}")
+
+    conn.execute('INSERT INTO Transaction_archive_state (id, Cutoff) VALUES (1, ?) '
+                 'ON CONFLICT (id) DO UPDATE SET Cutoff = max(Cutoff, excluded.Cutoff)', (cutoff,))
+    conn.commit()
+    return {"cutoff": archive_cutoff(conn), "archived": archived}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Move old transactions into monthly archive databases.")
+    parser.add_argument('--db', default='task5db.db')
+    parser.add_argument('--horizon-days', type=int, default=ARCHIVE_HORIZON_DAYS,
+                        help='Transactions older than this (rounded down to a month start) are archived')
+    parser.add_argument('--archive-dir', help='Directory for the archive files, relative to the database '
+                                              '(default: <db name>_archive)')
+    parser.add_argument('--list', action='store_true', help='List the archived partitions and exit')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    if args.list:
+        print(f"Cutoff: {archive_cutoff(conn)}")
+        for partition in (conn.execute('SELECT * FROM Transaction_archive ORDER BY Month').fetchall()
+                          if archive_cutoff(conn) else []):
+            print(partition)
+    else:
+        print(archive_transactions(conn, args.horizon_days, args.archive_dir))
+    conn.close()
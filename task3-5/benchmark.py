@@ -0,0 +1,248 @@
+import os
+import csv
+import json
+import time
+import random
+import string
+import sqlite3
+import logging
+import platform
+import argparse
+import tempfile
+from functools import partial
+import datagen
+import task5_1
+from exchange_rates import configure_rates
+from report_runner import take_snapshot
+
+BENCH_ITERATIONS = 200
+ANALYTICS_ITERATIONS = 5
+BULK_ROWS = 1000
+# Relative change in ops/s, p50 or p99 that compare() reports as a regression
+REGRESSION_THRESHOLD = 0.10
+SEED_RATES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'exchange_rates_seed.json')
+# Cases that delete or rewrite generated data run on a throwaway copy of the database, so every run (and every
+# --reuse run) measures the other cases against the same data
+DESTRUCTIVE_CASES = ('modify_user', 'delete_user', 'assign_random_discounts', 'delete_incomplete_users_and_accounts')
+
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))]
+
+
+# Call func(*make_args(i)) `iterations` times and summarize the per-call latencies
+def measure(func, make_args, iterations, rows_per_op=1):
+    latencies = []
+    failures = 0
+    for i in range(iterations):
+        args = make_args(i)
+        started = time.perf_counter()
+        result = func(*args)
+        latencies.append(time.perf_counter() - started)
+        if not isinstance(result, dict) or result.get("status") != "success":
+            failures += 1
+    latencies.sort()
+    total = sum(latencies)
+    return {
+        "iterations": iterations,
+        "rows_per_op": rows_per_op,
+        "ops_per_sec": iterations / total if total else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "failures": failures,
+    }
+
+
+# Three letters no account number of the database uses yet: the bank names and account numbers of a run's write
+# cases carry it, so a --reuse run never times uniqueness failures against the rows of an earlier run
+def run_nonce(conn):
+    letters = random.SystemRandom()
+    while True:
+        nonce = ''.join(letters.choice(string.ascii_lowercase) for _ in range(3))
+        if nonce != 'syn' and not conn.execute("SELECT 1 FROM Account WHERE Account_Number LIKE ? LIMIT 1",
+                                               (f"ID--{nonce}-%",)).fetchone():
+            return nonce
+
+
+# Benchmark cases: (name, function, args for iteration i, iterations, rows per call).
+# Write cases use their own names and account numbers, so they never collide with the generated data.
+def benchmark_cases(db_path, seed, iterations, analytics_iterations, bulk_rows, csv_path):
+    conn = sqlite3.connect(db_path)
+    users = conn.execute('SELECT MAX(id) FROM User').fetchone()[0] or 1
+    banks = conn.execute('SELECT MAX(id) FROM Bank').fetchone()[0] or 1
+    accounts = conn.execute("SELECT COUNT(*) FROM Account WHERE Account_Number LIKE 'ID--syn-%'").fetchone()[0] or 1
+    hot_user = conn.execute('SELECT User_id FROM Account GROUP BY User_id ORDER BY COUNT(*) DESC LIMIT 1').fetchone()
+    nonce = run_nonce(conn)
+    conn.close()
+    hot_user = hot_user[0] if hot_user else 1
+    rng = random.Random(seed)
+    deleted_users = rng.sample(range(1, users + 1), min(iterations, users))
+
+    def user(i):
+        return ("Bench User", '1990-01-01', '')
+
+    # add_account numbers from 0, add_accounts_bulk ones from 10**8
+    def account(i):
+        return (rng.randint(1, users), 'debit', f"ID--{nonce}-{i:09d}-", rng.randint(1, banks), 'USD', 100.0, 'gold')
+
+    def transfer(i):
+        return (datagen.account_number(rng.randint(1, accounts)), datagen.account_number(rng.randint(1, accounts)),
+                round(rng.uniform(0.01, 10), 2))
+
+    with open(csv_path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['user_full_name', 'birth_day', 'accounts'])
+        writer.writerows([f"Csv User{i}", '1990-01-01', ''] for i in range(bulk_rows))
+
+    return [
+        ("add_user", task5_1.add_user, user, iterations, 1),
+        ("add_bank", task5_1.add_bank, lambda i: (f"Bench Bank {nonce} {i}",), iterations, 1),
+        ("add_account", task5_1.add_account, account, iterations, 1),
+        ("add_users_from_csv", task5_1.add_users_from_csv, lambda i: (csv_path,), analytics_iterations, bulk_rows),
+        ("add_users_bulk", task5_1.add_users_bulk, lambda i: ([user(i)] * bulk_rows,), analytics_iterations,
+         bulk_rows),
+        ("add_banks_bulk", task5_1.add_banks_bulk,
+         lambda i: ([(f"Bulk Bank {nonce} {i}-{j}",) for j in range(bulk_rows)],), analytics_iterations, bulk_rows),
+        ("add_accounts_bulk", task5_1.add_accounts_bulk,
+         lambda i: ([account(10 ** 8 + i * bulk_rows + j) for j in range(bulk_rows)],), analytics_iterations,
+         bulk_rows),
+        ("add_users_from_csv_bulk", task5_1.add_users_from_csv_bulk, lambda i: (csv_path,), analytics_iterations,
+         bulk_rows),
+        ("transfer_money", task5_1.transfer_money, transfer, iterations, 1),
+        ("transfer_money_batch", task5_1.transfer_money_batch,
+         lambda i: ([transfer(j) for j in range(bulk_rows)],), analytics_iterations, bulk_rows),
+        ("users_with_debts", task5_1.users_with_debts, lambda i: (), analytics_iterations, 1),
+        ("users_with_debts_page", task5_1.users_with_debts, lambda i: (1000,), iterations, 1),
+        ("bank_with_biggest_capital", task5_1.bank_with_biggest_capital, lambda i: (), iterations, 1),
+        ("bank_with_oldest_client", task5_1.bank_with_oldest_client, lambda i: (), iterations, 1),
+        ("bank_capital_by_currency", task5_1.bank_capital_by_currency, lambda i: (), iterations, 1),
+        ("bank_with_most_unique_users_outbound", task5_1.bank_with_most_unique_users_outbound, lambda i: (),
+         analytics_iterations, 1),
+        ("user_transactions_last_3_months", task5_1.user_transactions_last_3_months, lambda i: (hot_user,),
+         iterations, 1),
+        ("user_transactions_last_3_months_page", task5_1.user_transactions_last_3_months,
+         lambda i: (hot_user, 100), iterations, 1),
+        ("modify_user", partial(task5_1.modify_user, Birth_day='1985-05-05'), lambda i: (rng.randint(1, users),),
+         iterations, 1),
+        ("delete_user", task5_1.delete_user, lambda i: (deleted_users[i % len(deleted_users)],), iterations, 1),
+        ("assign_random_discounts", task5_1.assign_random_discounts, lambda i: (seed + i,), analytics_iterations, 1),
+        ("delete_incomplete_users_and_accounts", task5_1.delete_incomplete_users_and_accounts, lambda i: (),
+         analytics_iterations, 1),
+    ]
+
+
+def run(db_path, output, sizes, iterations, analytics_iterations, bulk_rows, reuse, only):
+    if not reuse:
+        datagen.generate(db_path, sizes["seed"], sizes["banks"], sizes["users"], sizes["accounts"],
+                         sizes["transactions"], sizes["skew"])
+    task5_1.configure_db(db_path)
+    configure_rates(source_file=SEED_RATES_FILE)
+
+    handle, csv_path = tempfile.mkstemp(suffix='.csv', prefix='bench_users_')
+    os.close(handle)
+    results = {}
+    try:
+        cases = [case for case in benchmark_cases(db_path, sizes["seed"], iterations, analytics_iterations, bulk_rows,
+                                                  csv_path) if not only or case[0] in only]
+        run_cases([case for case in cases if case[0] not in DESTRUCTIVE_CASES], results)
+        destructive = [case for case in cases if case[0] in DESTRUCTIVE_CASES]
+        if destructive:
+            copy_path = take_snapshot(db_path)
+            task5_1.configure_db(copy_path)
+            try:
+                run_cases(destructive, results)
+            finally:
+                task5_1.pool.close_all()
+                task5_1.configure_db(db_path)
+                for suffix in ('', '-wal', '-shm'):
+                    if os.path.exists(copy_path + suffix):
+                        os.remove(copy_path + suffix)
+    finally:
+        os.remove(csv_path)
+
+    report = {
+        "meta": {
+            "created": task5_1.format_datetime(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "sizes": sizes,
+            "iterations": iterations,
+            "analytics_iterations": analytics_iterations,
+            "bulk_rows": bulk_rows,
+        },
+        "results": results,
+    }
+    with open(output, 'w') as file:
+        json.dump(report, file, indent=2)
+    logging.info(f"Results saved to {output}")
+    return report
+
+
+def run_cases(cases, results):
+    for name, func, make_args, count, rows_per_op in cases:
+        results[name] = measure(func, make_args, count, rows_per_op)
+        logging.info(f"{name}: {results[name]['ops_per_sec']:,.1f} ops/s, p50 {results[name]['p50_ms']:.3f}ms, "
+                     f"p99 {results[name]['p99_ms']:.3f}ms, {results[name]['failures']} failed")
+
+
+# Compare two result files, a benchmark regresses when it got slower than the threshold on any metric
+def compare(baseline_path, current_path, threshold=REGRESSION_THRESHOLD):
+    with open(baseline_path) as file:
+        baseline = json.load(file)["results"]
+    with open(current_path) as file:
+        current = json.load(file)["results"]
+
+    regressions = []
+    print(f"{'benchmark':<40} {'ops/s':>12} {'change':>8} {'p50 ms':>10} {'change':>8} {'p99 ms':>10} {'change':>8}")
+    for name in sorted(set(baseline) | set(current)):
+        if name not in baseline or name not in current:
+            print(f"{name:<40} only in {'current' if name in current else 'baseline'}")
+            continue
+        before, after = baseline[name], current[name]
+        changes = {
+            "ops_per_sec": relative_change(before["ops_per_sec"], after["ops_per_sec"]),
+            "p50_ms": relative_change(before["p50_ms"], after["p50_ms"]),
+            "p99_ms": relative_change(before["p99_ms"], after["p99_ms"]),
+        }
+        regressed = [metric for metric, change in changes.items()
+                     if (change < -threshold if metric == "ops_per_sec" else change > threshold)]
+        if regressed:
+            regressions.append({"benchmark": name, "metrics": regressed, "changes": changes})
+        print(f"{name:<40} {after['ops_per_sec']:>12,.1f} {changes['ops_per_sec']:>+8.1%} "
+              f"{after['p50_ms']:>10.3f} {changes['p50_ms']:>+8.1%} {after['p99_ms']:>10.3f} "
+              f"{changes['p99_ms']:>+8.1%}{'  REGRESSION' if regressed else ''}")
+    print(f"{len(regressions)} regression(s) above {threshold:.0%}")
+    return regressions
+
+
+def relative_change(before, after):
+    return (after - before) / before if before else 0.0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the task5_1 API on synthetic data.")
+    parser.add_argument('--db', default='benchmark.db', help='Benchmark database (regenerated unless --reuse)')
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--reuse', action='store_true', help='Benchmark an existing --db instead of generating one')
+    parser.add_argument('--only', nargs='+', help='Run only these benchmarks')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--banks', type=int, default=20)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--accounts', type=int, default=20000)
+    parser.add_argument('--transactions', type=int, default=100000)
+    parser.add_argument('--skew', type=float, default=2.0)
+    parser.add_argument('--iterations', type=int, default=BENCH_ITERATIONS, help='Calls per point operation')
+    parser.add_argument('--analytics-iterations', type=int, default=ANALYTICS_ITERATIONS,
+                        help='Calls per full-scan report and bulk operation')
+    parser.add_argument('--bulk-rows', type=int, default=BULK_ROWS, help='Rows per bulk call')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'),
+                        help='Compare two result files instead of running, exits with 1 on regressions')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args()
+
+    if args.compare:
+        raise SystemExit(1 if compare(args.compare[0], args.compare[1], args.threshold) else 0)
+    sizes = {"seed": args.seed, "banks": args.banks, "users": args.users, "accounts": args.accounts,
+             "transactions": args.transactions, "skew": args.skew}
+    run(args.db, args.output, sizes, args.iterations, args.analytics_iterations, args.bulk_rows, args.reuse,
+        args.only)
@@ -0,0 +1,69 @@
+import sqlite3
+from itertools import islice
+from task3 import suspend_summaries, resume_summaries
+
+BULK_CHUNK_SIZE = 10000
+# From this many valid rows a chunk updates the summary tables once instead of through the per-row trigger
+BULK_SUMMARY_ROWS = 1000
+
+USER_INSERT_SQL = "INSERT INTO User (Name, Surname, Birth_day, Accounts) VALUES (?, ?, ?, ?)"
+BANK_INSERT_SQL = "INSERT INTO Bank (name) VALUES (?)"
+ACCOUNT_INSERT_SQL = ("INSERT INTO Account (User_id, Type, Account_Number, Bank_id, Currency, Amount, Status) "
+                      "VALUES (?, ?, ?, ?, ?, ?, ?)")
+
+
+# Validate each chunk of rows at once with a batch validator from validators.py and insert the valid ones with
+# executemany, one transaction per chunk. Invalid rows are rejected individually instead of aborting the whole load.
+# table names the table sql inserts into when its rows feed the summary tables of schema v3 (only Account: a new
+# user changes them only for accounts left behind by a deleted user, which its cheap trigger handles).
+def bulk_insert(conn, sql, rows, validate, chunk_size=BULK_CHUNK_SIZE, table=None):
+    report = {"inserted": 0, "rejected": []}
+    rows = iter(rows)
+    row_number = 1
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        valid, rejected = validate(chunk, row_number)
+        report["rejected"].extend(rejected)
+        if valid:
+            insert_chunk(conn, sql, valid, report, table)
+        row_number += len(chunk)
+    report["rejected"].sort(key=lambda rejection: rejection["row"])
+    return report
+
+
+def insert_chunk(conn, sql, batch, report, table=None):
+    try:
+        if table and len(batch) >= BULK_SUMMARY_ROWS:
+            insert_summarized(conn, sql, batch, table)
+        else:
+            conn.executemany(sql, [params for _, params in batch])
+        conn.commit()
+        report["inserted"] += len(batch)
+    except sqlite3.IntegrityError:
+        # Some row violates a constraint: redo this chunk row by row to find out which ones
+        conn.rollback()
+        for row_number, params in batch:
+            try:
+                conn.execute(sql, params)
+                report["inserted"] += 1
+            except sqlite3.IntegrityError as e:
+                report["rejected"].append({"row": row_number, "error": str(e)})
+        conn.commit()
+
+
+# The insert trigger is suspended by a Summary_suspended row written in the chunk's own transaction: no schema
+# change, other connections never see the row, and a failed chunk rolls it back with the inserts
+def insert_summarized(conn, sql, batch, table):
+    conn.commit()
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    last_id = suspend_summaries(cursor, table)
+    cursor.executemany(sql, [params for _, params in batch])
+    resume_summaries(cursor, table, last_id)
+
+
+def bulk_result(entity, report):
+    message = f"{entity} bulk load: {report['inserted']} inserted, {len(report['rejected'])} rejected"
+    return {"status": "success", "message": message, "data": report}
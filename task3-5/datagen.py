@@ -0,0 +1,170 @@
+import os
+import time
+import random
+import sqlite3
+import logging
+import argparse
+from array import array
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+import task3
+
+logging.basicConfig(level=logging.INFO)
+
+GENERATE_CHUNK_SIZE = 50000
+
+# Weighted like a retail bank: mostly local currencies, few premium accounts
+CURRENCIES = ['USD', 'EUR', 'GBP', 'UAH', 'PLN', 'CHF', 'JPY', 'CAD']
+CURRENCY_WEIGHTS = [40, 25, 8, 12, 6, 3, 3, 3]
+ACCOUNT_TYPES = ['debit', 'credit']
+ACCOUNT_TYPE_WEIGHTS = [70, 30]
+STATUSES = ['silver', 'gold', 'platinum']
+STATUS_WEIGHTS = [60, 30, 10]
+FIRST_NAMES = ['Olena', 'Ivan', 'Anna', 'Petro', 'Maria', 'Taras', 'Sofia', 'Andrii', 'Iryna', 'Mykola',
+               'John', 'Emma', 'Liam', 'Olivia', 'Noah', 'Ava', 'James', 'Mia', 'Lucas', 'Chloe']
+SURNAMES = ['Shevchenko', 'Kovalenko', 'Bondarenko', 'Tkachenko', 'Kravchenko', 'Melnyk', 'Boyko', 'Moroz',
+            'Smith', 'Johnson', 'Brown', 'Taylor', 'Wilson', 'Davies', 'Evans', 'Thomas', 'Roberts', 'Walker']
+
+# Share of users without a birth day, picked up by delete_incomplete_users_and_accounts
+MISSING_BIRTH_DAY_RATE = 0.01
+# Share of credit accounts with a negative balance
+DEBT_RATE = 0.2
+
+
+# Ids in 1..n where low ids are much more likely: skew 1 is uniform, larger values concentrate on a few hot ids
+def skewed_id(rng, n, skew):
+    return int(n * rng.random() ** skew) + 1
+
+
+# One generator per table, each seeded on its own so changing one size does not reshuffle the other tables
+def table_rng(seed, table):
+    return random.Random(f"{seed}:{table}")
+
+
+def account_number(i):
+    return f"ID--syn-{i:09d}-"
+
+
+def generate_banks(seed, banks):
+    rng = table_rng(seed, 'banks')
+    for i in range(1, banks + 1):
+        yield (f"{rng.choice(SURNAMES)} Bank {i}",)
+
+
+def generate_users(seed, users):
+    rng = table_rng(seed, 'users')
+    for _ in range(users):
+        birth_day = None
+        if rng.random() >= MISSING_BIRTH_DAY_RATE:
+            birth_day = f"{rng.randint(1940, 2005)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+        yield rng.choice(FIRST_NAMES), rng.choice(SURNAMES), birth_day, ''
+
+
+# Accounts are owned by skewed users and banks, bank_of/currency_of keep what transactions need (a few bytes per account)
+def generate_accounts(seed, accounts, users, banks, skew, bank_of, currency_of):
+    rng = table_rng(seed, 'accounts')
+    for i in range(1, accounts + 1):
+        bank_id = skewed_id(rng, banks, skew)
+        currency = rng.choices(range(len(CURRENCIES)), weights=CURRENCY_WEIGHTS)[0]
+        account_type = rng.choices(ACCOUNT_TYPES, weights=ACCOUNT_TYPE_WEIGHTS)[0]
+        # Log-normal balances in minor units, median around 500.00
+        amount = int(rng.lognormvariate(10.8, 1.5))
+        if account_type == 'credit' and rng.random() < DEBT_RATE:
+            amount = -amount
+        bank_of.append(bank_id)
+        currency_of.append(currency)
+        yield (skewed_id(rng, users, skew), account_type, account_number(i), bank_id, CURRENCIES[currency], amount,
+               rng.choices(STATUSES, weights=STATUS_WEIGHTS)[0])
+
+
+# Senders are skewed towards hot accounts, timestamps towards the end of the window
+def generate_transactions(seed, transactions, accounts, skew, days, end, bank_names, bank_of, currency_of):
+    rng = table_rng(seed, 'transactions')
+    window = days * 86400
+    for _ in range(transactions):
+        sender = skewed_id(rng, accounts, skew)
+        receiver = rng.randint(1, accounts)
+        sent_at = end - timedelta(seconds=int(window * rng.random() ** 2))
+        yield (bank_names[bank_of[sender - 1]], sender, bank_names[bank_of[receiver - 1]], receiver,
+               CURRENCIES[currency_of[sender - 1]], int(rng.lognormvariate(8.5, 1.2)), task3.format_datetime(sent_at))
+
+
+def insert_stream(conn, table, sql, rows, chunk_size):
+    inserted = 0
+    started = time.perf_counter()
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        conn.executemany(sql, chunk)
+        inserted += len(chunk)
+    conn.commit()
+    elapsed = time.perf_counter() - started
+    logging.info(f"{table}: {inserted} rows in {elapsed:.1f}s ({inserted / max(elapsed, 1e-9):,.0f} rows/s)")
+    return inserted
+
+
+# Build a fresh database. Indexes and summary triggers are created after the load, summaries are rebuilt once.
+def generate(db_path, seed=0, banks=20, users=10000, accounts=20000, transactions=100000, skew=2.0, days=365,
+             end=None, chunk_size=GENERATE_CHUNK_SIZE):
+    if end is None:
+        end = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute('PRAGMA journal_mode = OFF')
+    cursor.execute('PRAGMA synchronous = OFF')
+    cursor.execute('PRAGMA cache_size = -256000')
+    task3.create_tables(cursor, False)
+    for kind, name in cursor.execute("SELECT type, name FROM sqlite_master WHERE type IN ('index', 'trigger') "
+                                     "AND (name LIKE 'idx_%' OR name LIKE 'summary_%')").fetchall():
+        cursor.execute(f'DROP {kind.upper()} {name}')
+    conn.commit()
+
+    bank_names = [name for (name,) in generate_banks(seed, banks)]
+    insert_stream(conn, 'Bank', "INSERT INTO Bank (id, name) VALUES (?, ?)",
+                  ((i, name) for i, name in enumerate(bank_names, start=1)), chunk_size)
+    bank_names = [''] + bank_names
+    insert_stream(conn, 'User', "INSERT INTO User (Name, Surname, Birth_day, Accounts) VALUES (?, ?, ?, ?)",
+                  generate_users(seed, users), chunk_size)
+    bank_of, currency_of = array('i'), array('b')
+    insert_stream(conn, 'Account', "INSERT INTO Account (User_id, Type, Account_Number, Bank_id, Currency, Amount, "
+                                   "Status) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                  generate_accounts(seed, accounts, users, banks, skew, bank_of, currency_of), chunk_size)
+    if accounts:
+        insert_stream(conn, 'Transaction', 'INSERT INTO "Transaction" (Bank_sender_name, Account_sender_id, '
+                                           'Bank_receiver_name, Account_receiver_id, Sent_Currency, Sent_Amount, '
+                                           'Datetime) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                      generate_transactions(seed, transactions, accounts, skew, days, end, bank_names, bank_of,
+                                            currency_of), chunk_size)
+
+    started = time.perf_counter()
+    task3.create_indexes(cursor)
+    task3.create_summary_tables(cursor)
+    task3.rebuild_summaries(cursor)
+    conn.commit()
+    cursor.execute('ANALYZE')
+    cursor.execute('PRAGMA journal_mode = WAL')
+    conn.close()
+    logging.info(f"Indexes, summaries and statistics built in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fill a fresh task3 database with deterministic synthetic data.")
+    parser.add_argument('--db', default='synthetic.db', help='Database file (recreated on every run)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--banks', type=int, default=20)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--accounts', type=int, default=20000)
+    parser.add_argument('--transactions', type=int, default=100000)
+    parser.add_argument('--skew', type=float, default=2.0, help='1 is uniform, larger values make hot users/banks')
+    parser.add_argument('--days', type=int, default=365, help='Transactions are spread over this many days')
+    parser.add_argument('--end', help='Last transaction day YYYY-MM-DD (default: today, fix it for identical files)')
+    parser.add_argument('--chunk-size', type=int, default=GENERATE_CHUNK_SIZE)
+    args = parser.parse_args()
+    end = datetime.strptime(args.end, '%Y-%m-%d').replace(tzinfo=timezone.utc) if args.end else None
+    generate(args.db, args.seed, args.banks, args.users, args.accounts, args.transactions, args.skew, args.days, end,
+             args.chunk_size)
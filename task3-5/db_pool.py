@@ -0,0 +1,113 @@
+import os
+import sqlite3
+import logging
+import weakref
+import threading
+
+# Pragmas applied to every new pooled connection (negative cache_size is in KiB)
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -64000,
+    'mmap_size': 268435456,
+    'busy_timeout': 5000,
+    'temp_store': 'MEMORY',
+}
+
+
+# A thread's connection and the settings it was opened with. threading.local drops it when the thread exits,
+# and its finalizer then closes the connection, so short-lived threads do not leave connections behind.
+class ThreadConnection:
+    def __init__(self, pool, conn):
+        self.conn = conn
+        self.pid = os.getpid()
+        self.generation = pool.generation
+        self.finalizer = weakref.finalize(self, pool.release, conn)
+
+
+# Per-thread persistent SQLite connections.
+# Every thread reuses its own connection, so the statement cache survives between calls.
+class ConnectionPool:
+    def __init__(self, db_path, read_only=False, cached_statements=256, **pragmas):
+        self.db_path = db_path
+        self.read_only = read_only
+        self.cached_statements = cached_statements
+        self.pragmas = dict(DEFAULT_PRAGMAS, **pragmas)
+        self.generation = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+
+    def configure(self, db_path=None, **pragmas):
+        with self._lock:
+            if db_path:
+                self.db_path = db_path
+            self.pragmas.update(pragmas)
+            # Connections opened with the old settings are replaced on their next acquire
+            self.generation += 1
+
+    def connect(self):
+        if self.read_only:
+            conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False,
+                                   cached_statements=self.cached_statements)
+        else:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, cached_statements=self.cached_statements)
+        for name, value in self.pragmas.items():
+            if self.read_only and name == 'journal_mode':
+                continue
+            conn.execute(f"PRAGMA {name} = {value}")
+        with self._lock:
+            self._connections.append(conn)
+        return conn
+
+    def acquire(self):
+        slot = getattr(self._local, 'slot', None)
+        if slot is not None:
+            if slot.pid != os.getpid():
+                # Connections must not be shared with a forked child, just forget the inherited one
+                slot.finalizer.detach()
+                self.forget(slot.conn)
+                slot = None
+            elif slot.generation != self.generation or not self.is_healthy(slot.conn):
+                self.discard(slot.conn)
+                slot = None
+        if slot is None:
+            slot = ThreadConnection(self, self.connect())
+            self._local.slot = slot
+        return slot.conn
+
+    def is_healthy(self, conn):
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error as e:
+            logging.warning(f"Dropping unhealthy connection to {self.db_path}: {e}")
+            return False
+
+    def forget(self, conn):
+        with self._lock:
+            if conn in self._connections:
+                self._connections.remove(conn)
+
+    def release(self, conn):
+        self.forget(conn)
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def discard(self, conn):
+        slot = getattr(self._local, 'slot', None)
+        if slot is not None and slot.conn is conn:
+            self._local.slot = None
+        self.release(conn)
+
+    def close_all(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+            self.generation += 1
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
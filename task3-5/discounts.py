@@ -0,0 +1,115 @@
+import json
+import random
+import sqlite3
+import logging
+import argparse
+from task3 import to_minor_units, format_datetime
+
+logging.basicConfig(level=logging.INFO)
+
+DISCOUNT_VALUES = (25, 30, 50)
+HASH_RANGE = 2 ** 32
+
+
+# SQL expression mapping an integer column to a well mixed value in [0, 2**32) for a given seed: multiply, xorshift,
+# multiply (SQLite has no XOR, a ^ b = (a | b) - (a & b)). Every product stays below 2**63, so it never turns REAL.
+def hash_sql(column, seed, multiplier):
+    h = f"((({column} + {int(seed)}) * {multiplier}) & 4294967295)"
+    return f"(((({h} | ({h} >> 15)) - ({h} & ({h} >> 15))) * 73244475) & 4294967295)"
+
+
+# WHERE conditions on Account for the account rules, with their parameters
+def account_filters(statuses=None, bank_ids=None, min_balance=None, max_balance=None):
+    conditions, params = [], []
+    if statuses:
+        conditions.append(f"Account.Status IN ({', '.join('?' * len(statuses))})")
+        params.extend(statuses)
+    if bank_ids:
+        conditions.append(f"Account.Bank_id IN ({', '.join('?' * len(bank_ids))})")
+        params.extend(bank_ids)
+    if min_balance is not None:
+        conditions.append("Account.Amount >= ?")
+        params.append(to_minor_units(min_balance))
+    if max_balance is not None:
+        conditions.append("Account.Amount <= ?")
+        params.append(to_minor_units(max_balance))
+    return ' AND '.join(conditions) or '1', params
+
+
+# Select the campaign's accounts into its audit rows with one INSERT ... SELECT, then apply them with one UPDATE.
+# Users are the sampling unit: every matching account of a sampled user gets that user's discount.
+# sample_users picks that many users (lowest hashes), sample_rate a share of them; neither means every matching user.
+def run_campaign(conn, name, discounts=DISCOUNT_VALUES, seed=None, sample_users=None, sample_rate=None,
+                 statuses=None, bank_ids=None, min_balance=None, max_balance=None):
+    if not discounts:
+        raise ValueError("A campaign needs at least one discount value")
+    if sample_rate is not None and not 0 <= sample_rate <= 1:
+        raise ValueError("sample_rate must be between 0 and 1")
+    seed = random.randrange(2 ** 31) if seed is None else seed % 2 ** 31
+    where, params = account_filters(statuses, bank_ids, min_balance, max_balance)
+    user_hash = hash_sql("Account.User_id", seed, 2654435761)
+    discount_hash = hash_sql("Account.User_id", seed, 40503)
+    choose_discount = ' '.join(f"WHEN {i} THEN {int(discount)}" for i, discount in enumerate(discounts))
+
+    if sample_users is not None:
+        # +User_id keeps the planner from walking idx_account_user with a table lookup per account
+        sampled = (f"AND Account.User_id IN (SELECT User_id FROM (SELECT DISTINCT +Account.User_id AS User_id "
+                   f"FROM Account WHERE {where}) AS Account ORDER BY {user_hash} LIMIT {int(sample_users)})")
+        params = params + params
+    elif sample_rate is not None:
+        sampled = f"AND {user_hash} < {int(sample_rate * HASH_RANGE)}"
+    else:
+        sampled = ''
+
+    rules = {"discounts": list(discounts), "seed": seed, "sample_users": sample_users, "sample_rate": sample_rate,
+             "statuses": statuses, "bank_ids": bank_ids, "min_balance": min_balance, "max_balance": max_balance}
+    owns_transaction = not conn.in_transaction
+    if owns_transaction:
+        conn.execute('BEGIN IMMEDIATE')
+    try:
+        campaign_id = conn.execute("INSERT INTO Discount_campaign (Name, Created, Rules, Accounts) VALUES (?, ?, ?, 0)",
+                                   (name, format_datetime(), json.dumps(rules))).lastrowid
+        # The audit rows double as the list of chosen accounts. Written in Account.id order they are appended to
+        # the (Campaign_id, Account_id) key and the UPDATE below walks both tables in the same order.
+        accounts = conn.execute(f"""
+            INSERT INTO Discount_campaign_account (Campaign_id, Account_id, Discount, Previous_discount)
+            SELECT {int(campaign_id)}, Account.id, CASE {discount_hash} % {len(discounts)} {choose_discount} END,
+                   Account.Discount
+            FROM Account
+            WHERE {where} {sampled}
+            ORDER BY Account.id
+        """, params).rowcount
+        conn.execute("""
+            UPDATE Account SET Discount = c.Discount
+            FROM Discount_campaign_account AS c
+            WHERE c.Campaign_id = ? AND Account.id = c.Account_id
+        """, (campaign_id,))
+        conn.execute("UPDATE Discount_campaign SET Accounts = ? WHERE id = ?", (accounts, campaign_id))
+        if owns_transaction:
+            conn.commit()
+    except Exception:
+        if owns_transaction:
+            conn.rollback()
+        raise
+    return {"campaign_id": campaign_id, "accounts": accounts, "seed": seed}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run a discount campaign over the accounts of a task3 database.")
+    parser.add_argument('--db', default='task5db.db')
+    parser.add_argument('--name', default='campaign')
+    parser.add_argument('--discounts', type=int, nargs='+', default=list(DISCOUNT_VALUES), help='Discount percents')
+    parser.add_argument('--seed', type=int, help='Same seed, same users (default: random, recorded in the audit)')
+    parser.add_argument('--sample-users', type=int, help='Number of users to pick')
+    parser.add_argument('--sample-rate', type=float, help='Share of matching users to pick, 0..1')
+    parser.add_argument('--status', nargs='+', choices=['gold', 'silver', 'platinum'])
+    parser.add_argument('--bank-id', type=int, nargs='+')
+    parser.add_argument('--min-balance', type=float)
+    parser.add_argument('--max-balance', type=float)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    result = run_campaign(conn, args.name, args.discounts, args.seed, args.sample_users, args.sample_rate,
+                          args.status, args.bank_id, args.min_balance, args.max_balance)
+    conn.close()
+    logging.info(result)
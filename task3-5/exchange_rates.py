@@ -0,0 +1,160 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import argparse
+import threading
+from datetime import datetime, timezone
+import requests
+from task3 import DATETIME_FORMAT, format_datetime
+
+API_URL = "https://api.freecurrencyapi.com/v1/latest"
+API_KEY = os.environ.get('FREECURRENCYAPI_KEY', 'your_api_key_here')
+
+# Rates are stored against one base currency, other pairs are triangulated through it
+BASE_CURRENCY = 'USD'
+RATE_TTL = 3600
+
+
+# In-process cache of base -> currency rates with a time to live
+class RateCache:
+    def __init__(self, ttl=RATE_TTL, base_currency=BASE_CURRENCY, source_file=None):
+        self.ttl = ttl
+        self.base_currency = base_currency
+        # With a source file set, refreshes read it instead of calling the API (offline mode)
+        self.source_file = source_file
+        self.rates = {}
+        self.loaded_at = None
+        self.lock = threading.Lock()
+
+    def is_fresh(self):
+        return bool(self.rates) and time.monotonic() - self.loaded_at < self.ttl
+
+    def load(self, rates, age=0):
+        with self.lock:
+            self.rates = dict(rates, **{self.base_currency: 1.0})
+            self.loaded_at = time.monotonic() - age
+
+    def get(self, from_currency, to_currency):
+        rates = self.rates
+        if from_currency not in rates or to_currency not in rates:
+            raise ValueError(f"No exchange rate for {from_currency} -> {to_currency}")
+        return rates[to_currency] / rates[from_currency]
+
+
+rate_cache = RateCache(source_file=os.environ.get('EXCHANGE_RATES_FILE'))
+
+
+def configure_rates(ttl=None, base_currency=None, source_file=None):
+    if ttl is not None:
+        rate_cache.ttl = ttl
+    if base_currency:
+        rate_cache.base_currency = base_currency
+    if source_file:
+        rate_cache.source_file = source_file
+    rate_cache.rates = {}
+
+
+# One request returns the rates of every currency against the base currency
+def fetch_rates(base_currency):
+    response = requests.get(API_URL, params={'apikey': API_KEY, 'base_currency': base_currency}, timeout=10)
+    if response.status_code != 200:
+        raise Exception("Failed to fetch exchange rates")
+    return response.json()['data']
+
+
+# Seed file format matches the API response: {"base_currency": "USD", "data": {"EUR": 0.92, ...}}
+def load_rates_file(path, base_currency):
+    with open(path, mode='r', encoding='utf-8') as file:
+        content = json.load(file)
+    rates = content['data']
+    file_base = content.get('base_currency', base_currency)
+    if file_base != base_currency:
+        # Rebase the file onto the configured base currency
+        rates = dict(rates, **{file_base: 1.0})
+        rates = {currency: rate / rates[base_currency] for currency, rate in rates.items()}
+    return rates
+
+
+# Fetch the rates and store them in Exchange_rate (schema v5). The fetch may go over the network, so this never
+# runs inside a transaction: it would hold the write lock for the whole request.
+def refresh_rates(conn):
+    if conn.in_transaction:
+        raise RuntimeError("Exchange rates cannot be refreshed inside a transaction")
+    if rate_cache.source_file:
+        rates = load_rates_file(rate_cache.source_file, rate_cache.base_currency)
+    else:
+        rates = fetch_rates(rate_cache.base_currency)
+
+    updated_at = format_datetime()
+    with conn:
+        conn.executemany("INSERT OR REPLACE INTO Exchange_rate (Currency, Base_currency, Rate, Updated_at) "
+                         "VALUES (?, ?, ?, ?)",
+                         [(currency, rate_cache.base_currency, rate, updated_at) for currency, rate in rates.items()])
+    rate_cache.load(rates)
+    logging.info(f"Refreshed {len(rates)} exchange rates against {rate_cache.base_currency}")
+    return rates
+
+
+# Refresh on a connection of its own, so nothing is written through the caller's connection
+def refresh_rates_separately(conn):
+    path = conn.execute('PRAGMA database_list').fetchone()[2]
+    if not path:
+        # In-memory database: no other connection can reach it
+        return refresh_rates(conn)
+    own_conn = sqlite3.connect(path)
+    try:
+        return refresh_rates(own_conn)
+    finally:
+        own_conn.close()
+
+
+# Load the persisted table into the cache, returns False when nothing usable is stored
+def load_persisted_rates(conn, allow_stale=False):
+    rows = conn.execute("SELECT Currency, Rate, Updated_at FROM Exchange_rate WHERE Base_currency = ?",
+                        (rate_cache.base_currency,)).fetchall()
+    if not rows:
+        return False
+    oldest = min(datetime.strptime(row[2], DATETIME_FORMAT).replace(tzinfo=timezone.utc) for row in rows)
+    age = (datetime.now(timezone.utc) - oldest).total_seconds()
+    if age >= rate_cache.ttl and not allow_stale:
+        return False
+    # Stale rates are a fallback after a failed refresh, keep them for one TTL before retrying
+    rate_cache.load({currency: rate for currency, rate, _ in rows}, age=0 if allow_stale else age)
+    return True
+
+
+# Make the cache usable: reads the persisted table, refreshes it when it is stale. Call this before the
+# transaction that needs the rates starts, a refresh inside a transaction raises.
+def ensure_rates(conn):
+    if rate_cache.is_fresh() or load_persisted_rates(conn):
+        return
+    if conn.in_transaction:
+        raise RuntimeError("Exchange rates are stale, load them with ensure_rates before the transaction starts")
+    try:
+        refresh_rates_separately(conn)
+    except Exception as e:
+        if not load_persisted_rates(conn, allow_stale=True):
+            raise
+        logging.warning(f"Using stale exchange rates, refresh failed: {e}")
+
+
+def get_exchange_rate(conn, from_currency, to_currency):
+    if from_currency == to_currency:
+        return 1.0
+    ensure_rates(conn)
+    return rate_cache.get(from_currency, to_currency)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Refresh the persisted exchange rate table.")
+    parser.add_argument('--db', default='task4db.db', help='Path to the SQLite database (default: task4db.db)')
+    parser.add_argument('--file', help='Read rates from a seed JSON file instead of the API')
+    parser.add_argument('--base-currency', default=BASE_CURRENCY, help='Base currency (default: USD)')
+    args = parser.parse_args()
+
+    configure_rates(base_currency=args.base_currency, source_file=args.file)
+    conn = sqlite3.connect(args.db)
+    print(refresh_rates(conn))
+    conn.close()
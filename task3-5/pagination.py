@@ -0,0 +1,41 @@
+import json
+import base64
+import binascii
+
+PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 1000
+
+
+# Continuation tokens are the last sort key of a page, opaque to callers
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(token):
+    if not token:
+        return None
+    try:
+        return json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+    except (binascii.Error, ValueError, UnicodeError):
+        raise ValueError("Invalid continuation token")
+
+
+def check_page_size(page_size):
+    if type(page_size) is not int or page_size < 1:
+        raise ValueError(f"Page size must be a positive integer, got {page_size!r}")
+
+
+# Queries fetch page_size + 1 rows, the extra row only tells whether another page exists
+def paginate(rows, page_size, key):
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    return rows, encode_cursor(key(rows[-1]))
+
+
+def iter_rows(cursor, batch_size=STREAM_BATCH_SIZE):
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield from rows
@@ -0,0 +1,194 @@
+import os
+import time
+import logging
+import threading
+from collections import deque
+
+# Statements slower than this (seconds, execute plus fetches) get their EXPLAIN QUERY PLAN logged
+SLOW_QUERY_THRESHOLD = float(os.environ.get('DB_SLOW_QUERY_SECONDS', 0.1))
+SLOW_LOG_SIZE = 100
+
+
+# Normalize whitespace so the same statement from different call sites is counted once
+def statement_key(sql):
+    return ' '.join(sql.split())
+
+
+# Plan rows that read a whole table: "SCAN Account" or "SCAN Account USING INDEX ..." without a search key
+def full_scans(plan):
+    return [detail for detail in plan if detail.startswith('SCAN ') and not detail.startswith('SCAN CONSTANT ROW')]
+
+
+# Cursor proxy that times execute and the fetches that follow it, the sum is the statement's time
+class ProfiledCursor:
+    def __init__(self, cursor, call):
+        self._cursor = cursor
+        self._call = call
+        self._statement = None
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        while True:
+            row = self.fetchone()
+            if row is None:
+                return
+            yield row
+
+    def _timed(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            if self._statement:
+                self._statement[2] += time.perf_counter() - started
+
+    def execute(self, sql, params=()):
+        self._call.finish_statement(self._statement)
+        self._statement = [sql, params, 0.0]
+        self._timed(self._cursor.execute, sql, params)
+        return self
+
+    def executemany(self, sql, rows):
+        self._call.finish_statement(self._statement)
+        self._statement = [sql, None, 0.0]
+        self._timed(self._cursor.executemany, sql, rows)
+        return self
+
+    def fetchone(self):
+        return self._timed(self._cursor.fetchone)
+
+    def fetchmany(self, *args):
+        return self._timed(self._cursor.fetchmany, *args)
+
+    def fetchall(self):
+        return self._timed(self._cursor.fetchall)
+
+    def close(self):
+        self._call.finish_statement(self._statement)
+        self._statement = None
+        self._cursor.close()
+
+
+# Connection proxy handed to a profiled db_connection function, everything but statements goes to the real connection
+class ProfiledConnection:
+    def __init__(self, conn, call):
+        self._conn = conn
+        self._call = call
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self):
+        cursor = ProfiledCursor(self._conn.cursor(), self._call)
+        self._call.cursors.append(cursor)
+        return cursor
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, rows):
+        return self.cursor().executemany(sql, rows)
+
+
+# Statements of one decorated call, merged into the profiler when the call ends
+class CallProfile:
+    def __init__(self, profiler, function, conn):
+        self.profiler = profiler
+        self.function = function
+        self.raw_conn = conn
+        self.conn = ProfiledConnection(conn, self)
+        self.cursors = []
+        self.statements = []
+        self.started = time.perf_counter()
+
+    def finish_statement(self, statement):
+        if not statement:
+            return
+        sql, params, elapsed = statement
+        plan = None
+        if elapsed >= self.profiler.threshold:
+            plan = self.explain(sql, params)
+        self.statements.append((statement_key(sql), elapsed, plan))
+
+    def explain(self, sql, params):
+        if params is None:
+            return []
+        try:
+            return [row[3] for row in self.raw_conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()]
+        except Exception as e:
+            return [f"EXPLAIN QUERY PLAN failed: {e}"]
+
+    def finish(self):
+        for cursor in self.cursors:
+            self.finish_statement(cursor._statement)
+            cursor._statement = None
+        self.profiler.record(self.function, time.perf_counter() - self.started, self.statements)
+
+
+# Process-wide switch for the db_connection instrumentation. Disabled it costs one attribute check per call.
+class QueryProfiler:
+    def __init__(self, threshold=SLOW_QUERY_THRESHOLD):
+        self.enabled = os.environ.get('DB_PROFILE') == '1'
+        self.threshold = threshold
+        self.lock = threading.Lock()
+        self.reset()
+
+    def enable(self, threshold=None):
+        if threshold is not None:
+            self.threshold = threshold
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self.lock:
+            self.functions = {}
+            self.slow_log = deque(maxlen=SLOW_LOG_SIZE)
+
+    def start(self, function, conn):
+        return CallProfile(self, function, conn)
+
+    def record(self, function, elapsed, statements):
+        with self.lock:
+            stats = self.functions.setdefault(function, {
+                "calls": 0, "seconds": 0.0, "statements": 0, "statement_seconds": 0.0,
+                "slow_statements": 0, "full_scans": 0, "by_statement": {}
+            })
+            stats["calls"] += 1
+            stats["seconds"] += elapsed
+            for sql, statement_elapsed, plan in statements:
+                stats["statements"] += 1
+                stats["statement_seconds"] += statement_elapsed
+                by_statement = stats["by_statement"].setdefault(sql, {"count": 0, "seconds": 0.0, "max": 0.0})
+                by_statement["count"] += 1
+                by_statement["seconds"] += statement_elapsed
+                by_statement["max"] = max(by_statement["max"], statement_elapsed)
+                if plan is None:
+                    continue
+                scans = full_scans(plan)
+                stats["slow_statements"] += 1
+                stats["full_scans"] += 1 if scans else 0
+                self.slow_log.append({"function": function, "sql": sql, "seconds": statement_elapsed, "plan": plan,
+                                      "full_scans": scans})
+                logging.warning(f"Slow query in {function} ({statement_elapsed * 1000:.1f}ms): {sql}")
+                for detail in scans:
+                    logging.warning(f"Full scan in {function}: {detail}")
+
+    def get_stats(self):
+        with self.lock:
+            return {"functions": {name: dict(stats, by_statement=dict(stats["by_statement"]))
+                                  for name, stats in self.functions.items()},
+                    "slow_log": list(self.slow_log)}
+
+    def print_stats(self):
+        stats = self.get_stats()["functions"]
+        print(f"{'function':<45} {'calls':>7} {'total s':>9} {'sql':>7} {'sql s':>9} {'slow':>5} {'scans':>5}")
+        for name, function in sorted(stats.items(), key=lambda item: item[1]["seconds"], reverse=True):
+            print(f"{name:<45} {function['calls']:>7} {function['seconds']:>9.3f} {function['statements']:>7} "
+                  f"{function['statement_seconds']:>9.3f} {function['slow_statements']:>5} {function['full_scans']:>5}")
+
+
+profiler = QueryProfiler()
@@ -0,0 +1,81 @@
+import os
+import time
+import sqlite3
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from db_pool import ConnectionPool
+from archive import pin_archive_paths
+from profiling import profiler
+
+REPORT_TIMEOUT = 30
+REPORT_WORKERS = 4
+
+# SQLite VM instructions between two timeout checks
+PROGRESS_STEPS = 10000
+
+
+# Copy the database into a temporary file through the backup API, every report then reads the same state.
+# Archive partitions are not copied, the snapshot points at the ones next to db_path.
+def take_snapshot(db_path):
+    handle, snapshot_path = tempfile.mkstemp(suffix='.db', prefix='report_snapshot_')
+    os.close(handle)
+    source = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    target = sqlite3.connect(snapshot_path)
+    try:
+        source.backup(target)
+        # The copy inherits WAL mode, a rollback journal leaves no -wal/-shm files next to it
+        target.execute('PRAGMA journal_mode=DELETE')
+        pin_archive_paths(target, os.path.dirname(os.path.abspath(db_path)))
+    finally:
+        target.close()
+        source.close()
+    return snapshot_path
+
+
+# Run one db_connection report on a read-only pooled connection, aborting its queries after the timeout
+def run_report(pool, func, args, timeout):
+    conn = pool.acquire()
+    call = profiler.start(f"{func.__module__}.{func.__qualname__}", conn) if profiler.enabled else None
+    deadline = time.monotonic() + timeout
+    conn.set_progress_handler(lambda: time.monotonic() > deadline, PROGRESS_STEPS)
+    started = time.perf_counter()
+    try:
+        result = getattr(func, '__wrapped__', func)(call.conn if call else conn, *args)
+    except Exception as e:
+        result = {"status": "failure", "message": str(e)}
+    finally:
+        conn.set_progress_handler(None, 0)
+        if conn.in_transaction:
+            conn.rollback()
+        if call:
+            call.finish()
+    elapsed = time.perf_counter() - started
+    if time.monotonic() > deadline and result.get("status") == "failure":
+        result = {"status": "timeout", "message": f"Report exceeded {timeout}s and was interrupted"}
+    return result, elapsed
+
+
+# reports: list of (name, func, args) read-only db_connection functions. Returns {name: (result, seconds)}.
+def run_reports(db_path, reports, workers=REPORT_WORKERS, snapshot=False, timeout=REPORT_TIMEOUT):
+    snapshot_path = take_snapshot(db_path) if snapshot else None
+    pool = ConnectionPool(snapshot_path or db_path, read_only=True)
+    results = {}
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {name: executor.submit(run_report, pool, func, args, timeout) for name, func, args in reports}
+            for name, future in futures.items():
+                results[name] = future.result()
+    finally:
+        pool.close_all()
+        if snapshot_path:
+            os.remove(snapshot_path)
+    return results
+
+
+def print_timing_table(results):
+    width = max([len(name) for name in results] + [len('report')])
+    print(f"{'report':<{width}}  {'status':<8}  {'seconds':>8}")
+    for name, (result, elapsed) in sorted(results.items(), key=lambda item: item[1][1], reverse=True):
+        print(f"{name:<{width}}  {result.get('status', ''):<8}  {elapsed:>8.3f}")
+    logging.info(f"Ran {len(results)} reports, slowest took {max((elapsed for _, elapsed in results.values()), default=0):.3f}s")
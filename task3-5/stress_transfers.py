@@ -0,0 +1,96 @@
+import os
+import time
+import random
+import sqlite3
+import argparse
+import multiprocessing
+import task3
+
+
+# Fresh database with one bank and `accounts` USD debit accounts holding `balance` each
+def prepare_database(db_path, accounts, balance):
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    task3.create_tables(cursor, False)
+    cursor.execute("INSERT INTO Bank (name) VALUES ('StressBank')")
+    cursor.execute("INSERT INTO User (Name, Surname, Birth_day, Accounts) VALUES ('Stress', 'Test', NULL, '')")
+    cursor.executemany("INSERT INTO Account (User_id, Type, Account_Number, Bank_id, Currency, Amount, Status) "
+                       "VALUES (1, 'debit', ?, 1, 'USD', ?, 'gold')",
+                       [(account_number(i), task3.to_minor_units(balance)) for i in range(accounts)])
+    conn.commit()
+    conn.close()
+
+
+def account_number(i):
+    return f"ID--st-{i:010d}-"
+
+
+def random_transfers(rng, accounts, count, max_amount):
+    return [(account_number(rng.randrange(accounts)), account_number(rng.randrange(accounts)),
+             round(rng.uniform(0.01, max_amount), 2)) for _ in range(count)]
+
+
+def worker(db_path, mode, seed, accounts, transfers, batch_size, max_amount, results):
+    import task4
+    task4.configure_db(db_path)
+    rng = random.Random(seed)
+    completed = 0
+    if mode == 'batch':
+        for start in range(0, transfers, batch_size):
+            result = task4.transfer_money_batch(random_transfers(rng, accounts, min(batch_size, transfers - start),
+                                                                 max_amount))
+            completed += sum(1 for outcome in result.get("data", []) if outcome["status"] == "success")
+    else:
+        for sender, receiver, amount in random_transfers(rng, accounts, transfers, max_amount):
+            if task4.transfer_money(sender, receiver, amount)["status"] == "success":
+                completed += 1
+    results.put(completed)
+
+
+def run(db_path, mode, processes, accounts, transfers, batch_size, balance, max_amount):
+    prepare_database(db_path, accounts, balance)
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=worker, args=(db_path, mode, seed, accounts, transfers, batch_size,
+                                                            max_amount, results))
+               for seed in range(processes)]
+    started = time.perf_counter()
+    for process in workers:
+        process.start()
+    completed = sum(results.get() for _ in workers)
+    for process in workers:
+        process.join()
+    elapsed = time.perf_counter() - started
+
+    conn = sqlite3.connect(db_path)
+    total, negative = conn.execute("SELECT SUM(Amount), SUM(Amount < 0) FROM Account").fetchone()
+    recorded = conn.execute('SELECT COUNT(*) FROM "Transaction"').fetchone()[0]
+    conn.close()
+    expected_total = task3.to_minor_units(balance) * accounts
+    consistent = total == expected_total and negative == 0 and recorded == completed
+    attempted = processes * transfers
+    print(f"{mode:>6}: {attempted} transfers by {processes} processes in {elapsed:.2f}s "
+          f"({attempted / elapsed:,.0f} transfers/s), {completed} completed, "
+          f"balances {'consistent' if consistent else 'INCONSISTENT'} "
+          f"(total {total} of {expected_total}, {negative} negative, {recorded} recorded)")
+    return consistent
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Multi-process stress test for transfer_money and transfer_money_batch.")
+    parser.add_argument('--db', default='stress.db', help='Scratch database file (recreated on every run)')
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--accounts', type=int, default=1000)
+    parser.add_argument('--transfers', type=int, default=20000, help='Batch transfers per process')
+    parser.add_argument('--single-transfers', type=int, default=500, help='Single transfer_money calls per process')
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--balance', type=float, default=100)
+    parser.add_argument('--max-amount', type=float, default=150, help='Larger than the balance to exercise rejections')
+    args = parser.parse_args()
+
+    ok = run(args.db, 'single', args.processes, args.accounts, args.single_transfers, 1, args.balance, args.max_amount)
+    ok = run(args.db, 'batch', args.processes, args.accounts, args.transfers, args.batch_size, args.balance,
+             args.max_amount) and ok
+    raise SystemExit(0 if ok else 1)
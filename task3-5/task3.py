@@ -1,30 +1,97 @@
 import sqlite3
 import argparse
+from datetime import datetime, timezone
+from decimal import Decimal, ROUND_HALF_UP
 
-# Function to create tables
-def create_tables(cursor, unique_user_fields):
-    # Create Bank table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS Bank (
+# Schema version stored in PRAGMA user_version (databases created before versioning report 0)
+SCHEMA_VERSION = 7
+
+# Timestamps are stored as UTC text in this format so they sort and compare as strings
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+# Money is stored as integer minor units (cents)
+def to_minor_units(amount):
+    return int((Decimal(str(amount)) * 100).to_integral_value(rounding=ROUND_HALF_UP))
+
+
+def from_minor_units(amount):
+    return None if amount is None else amount / 100
+
+
+def format_datetime(dt=None):
+    dt = dt or datetime.now(timezone.utc)
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc)
+    return dt.strftime(DATETIME_FORMAT)
+
+
+def account_table_sql(table_name):
+    return f'''
+        CREATE TABLE IF NOT EXISTS {table_name} (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL UNIQUE
+            User_id INTEGER NOT NULL,
+            Type TEXT NOT NULL CHECK(Type IN ('credit', 'debit')),
+            Account_Number TEXT NOT NULL UNIQUE,
+            Bank_id INTEGER NOT NULL,
+            Currency TEXT NOT NULL,
+            Amount INTEGER NOT NULL,
+            Status TEXT CHECK(Status IN ('gold', 'silver', 'platinum')),
+            Discount INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY(User_id) REFERENCES User(id),
+            FOREIGN KEY(Bank_id) REFERENCES Bank(id)
         )
-    ''')
+    '''
 
-    # Create Transaction table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS "Transaction" (
+
+def transaction_table_sql(table_name):
+    return f'''
+        CREATE TABLE IF NOT EXISTS {table_name} (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             Bank_sender_name TEXT NOT NULL,
             Account_sender_id INTEGER NOT NULL,
             Bank_receiver_name TEXT NOT NULL,
             Account_receiver_id INTEGER NOT NULL,
             Sent_Currency TEXT NOT NULL,
-            Sent_Amount REAL NOT NULL,
-            Datetime TEXT
+            Sent_Amount INTEGER NOT NULL,
+            Datetime TEXT NOT NULL,
+            FOREIGN KEY(Account_sender_id) REFERENCES Account(id),
+            FOREIGN KEY(Account_receiver_id) REFERENCES Account(id)
+        )
+    '''
+
+
+# Secondary indexes of schema v2, each one covers the columns its report reads
+def create_indexes(cursor):
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_account_user ON Account (User_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_account_bank ON Account (Bank_id, User_id, Amount)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_transaction_sender ON "Transaction" (Account_sender_id, Datetime)')
+
+
+def get_schema_version(cursor):
+    version = cursor.execute('PRAGMA user_version').fetchone()[0]
+    if version == 0 and cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'Account'").fetchone():
+        return 1
+    return version
+
+
+# Function to create tables
+def create_tables(cursor, unique_user_fields):
+    version = get_schema_version(cursor)
+    if version and version < SCHEMA_VERSION:
+        raise ValueError(f"Database uses schema v{version}, run this script with --migrate first")
+
+    # Create Bank table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS Bank (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE
         )
     ''')
 
+    # Create Transaction table
+    cursor.execute(transaction_table_sql('"Transaction"'))
+
     # Create User table
     user_table_sql = '''
         CREATE TABLE IF NOT EXISTS User (
@@ -41,36 +108,612 @@ def create_tables(cursor, unique_user_fields):
     cursor.execute(user_table_sql)
 
     # Create Account table
+    cursor.execute(account_table_sql('Account'))
+
+    create_indexes(cursor)
+    create_summary_tables(cursor)
+    create_campaign_tables(cursor)
+    create_rates_table(cursor)
+    cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+
+# Migrate a v1 database in place: integer account foreign keys, minor-unit amounts, sortable UTC datetimes.
+# v1 stamped transactions with the naive local datetime.now().isoformat(), those are converted from the local time
+# zone of the host running the migration (values that carry an offset are converted with that offset).
+# v1 stored the sender's User_id and the receiver's Account_Number in "Transaction", both are resolved to Account.id.
+# Transactions whose accounts cannot be resolved are kept in Transaction_v1_orphans.
+def migrate_to_v2(conn):
+    cursor = conn.cursor()
+    if get_schema_version(cursor) != 1:
+        raise ValueError("Database is not a schema v1 database")
+
+    conn.commit()
+    foreign_keys = cursor.execute('PRAGMA foreign_keys').fetchone()[0]
+    cursor.execute('PRAGMA foreign_keys = OFF')
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        cursor.execute(account_table_sql('Account_v2'))
+        cursor.execute('''
+            INSERT INTO Account_v2 (id, User_id, Type, Account_Number, Bank_id, Currency, Amount, Status)
+            SELECT id, User_id, Type, Account_Number, Bank_id, Currency, CAST(ROUND(Amount * 100) AS INTEGER), Status
+            FROM Account
+        ''')
+
+        cursor.execute('''
+            CREATE TEMP TABLE resolved_transaction AS
+            SELECT t.*,
+                   COALESCE(
+                       (SELECT a.id FROM Account a WHERE a.Account_Number = t.Account_sender_id),
+                       (SELECT MIN(a.id) FROM Account a
+                        WHERE a.User_id = t.Account_sender_id AND a.Currency = t.Sent_Currency),
+                       (SELECT MIN(a.id) FROM Account a WHERE a.User_id = t.Account_sender_id)
+                   ) AS sender_account_id,
+                   COALESCE(
+                       (SELECT a.id FROM Account a WHERE a.Account_Number = t.Account_receiver_id),
+                       (SELECT a.id FROM Account a WHERE a.id = t.Account_receiver_id)
+                   ) AS receiver_account_id
+            FROM "Transaction" t
+        ''')
+        cursor.execute(transaction_table_sql('Transaction_v2'))
+        cursor.execute('''
+            INSERT INTO Transaction_v2 (id, Bank_sender_name, Account_sender_id, Bank_receiver_name,
+                                        Account_receiver_id, Sent_Currency, Sent_Amount, Datetime)
+            SELECT id, Bank_sender_name, sender_account_id, Bank_receiver_name, receiver_account_id, Sent_Currency,
+                   CAST(ROUND(Sent_Amount * 100) AS INTEGER),
+                   COALESCE(CASE WHEN Datetime GLOB '*[+-][0-9][0-9]:[0-9][0-9]' OR Datetime GLOB '*Z'
+                                 THEN strftime('%Y-%m-%d %H:%M:%S', Datetime)
+                                 ELSE strftime('%Y-%m-%d %H:%M:%S', Datetime, 'utc') END,
+                            Datetime, '1970-01-01 00:00:00')
+            FROM temp.resolved_transaction
+            WHERE sender_account_id IS NOT NULL AND receiver_account_id IS NOT NULL
+        ''')
+        migrated = cursor.rowcount
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS Transaction_v1_orphans AS
+            SELECT id, Bank_sender_name, Account_sender_id, Bank_receiver_name, Account_receiver_id,
+                   Sent_Currency, Sent_Amount, Datetime
+            FROM temp.resolved_transaction
+            WHERE sender_account_id IS NULL OR receiver_account_id IS NULL
+        ''')
+        orphans = cursor.execute('SELECT COUNT(*) FROM Transaction_v1_orphans').fetchone()[0]
+        cursor.execute('DROP TABLE temp.resolved_transaction')
+
+        cursor.execute('DROP TABLE "Transaction"')
+        cursor.execute('DROP TABLE Account')
+        cursor.execute('ALTER TABLE Account_v2 RENAME TO Account')
+        cursor.execute('ALTER TABLE Transaction_v2 RENAME TO "Transaction"')
+        create_indexes(cursor)
+        cursor.execute('PRAGMA user_version = 2')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.execute(f'PRAGMA foreign_keys = {foreign_keys}')
+
+    cursor.execute('ANALYZE')
+    return {"transactions_migrated": migrated, "transactions_orphaned": orphans}
+
+
+# Schema v3: per-bank summaries kept current by triggers, so the capital and oldest client reports read O(banks) rows
+def create_summary_tables(cursor):
     cursor.execute('''
-        CREATE TABLE IF NOT EXISTS Account (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            User_id INTEGER NOT NULL,
-            Type TEXT NOT NULL CHECK(Type IN ('credit', 'debit')),
-            Account_Number TEXT NOT NULL UNIQUE,
+        CREATE TABLE IF NOT EXISTS Bank_capital (
             Bank_id INTEGER NOT NULL,
             Currency TEXT NOT NULL,
-            Amount REAL NOT NULL,
-            Status TEXT CHECK(Status IN ('gold', 'silver', 'platinum')),
-            FOREIGN KEY(User_id) REFERENCES User(id),
-            FOREIGN KEY(Bank_id) REFERENCES Bank(id)
+            Capital INTEGER NOT NULL,
+            Account_count INTEGER NOT NULL,
+            PRIMARY KEY (Bank_id, Currency)
         )
     ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS Bank_client (
+            Bank_id INTEGER PRIMARY KEY,
+            Oldest_birth_day TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_bank_client_oldest ON Bank_client (Oldest_birth_day)')
+    create_birth_day_table(cursor)
+    create_suspended_table(cursor)
+
+    for trigger_sql in SUMMARY_TRIGGERS:
+        cursor.execute(trigger_sql)
+
+
+def add_capital_sql(bank_id, currency, amount, count):
+    return f'''
+            INSERT INTO Bank_capital (Bank_id, Currency, Capital, Account_count)
+            VALUES ({bank_id}, {currency}, {amount}, {count})
+            ON CONFLICT (Bank_id, Currency) DO UPDATE SET
+                Capital = Capital + excluded.Capital, Account_count = Account_count + excluded.Account_count;
+            DELETE FROM Bank_capital WHERE Bank_id = {bank_id} AND Currency = {currency} AND Account_count = 0;'''
+
+
+# Schema v6: number of accounts per bank and client birth date. A bank's oldest client is the first row of its
+# counts, so removing a client is a decrement and one index seek instead of a scan of every account of the bank.
+def create_birth_day_table(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS Bank_birth_day (
+            Bank_id INTEGER NOT NULL,
+            Birth_day TEXT NOT NULL,
+            Accounts INTEGER NOT NULL,
+            PRIMARY KEY (Bank_id, Birth_day)
+        ) WITHOUT ROWID
+    ''')
+
+
+# Schema v7: a row here switches off the insert trigger of that table. Bulk loads write it inside their own
+# transaction, so other connections never see it.
+def create_suspended_table(cursor):
+    cursor.execute('CREATE TABLE IF NOT EXISTS Summary_suspended (Table_name TEXT PRIMARY KEY) WITHOUT ROWID')
+
+
+def user_birth_day_sql(user_id):
+    return f'(SELECT Birth_day FROM User WHERE id = {user_id})'
+
+
+# One more account of a client born on birth_day in a bank
+def add_client_sql(bank_id, birth_day):
+    return f'''
+            INSERT INTO Bank_birth_day (Bank_id, Birth_day, Accounts)
+            SELECT {bank_id}, {birth_day}, 1 WHERE {birth_day} IS NOT NULL
+            ON CONFLICT (Bank_id, Birth_day) DO UPDATE SET Accounts = Accounts + 1;
+            INSERT INTO Bank_client (Bank_id, Oldest_birth_day)
+            SELECT {bank_id}, {birth_day} WHERE {birth_day} IS NOT NULL
+            ON CONFLICT (Bank_id) DO UPDATE SET Oldest_birth_day = MIN(Oldest_birth_day, excluded.Oldest_birth_day);'''
+
+
+# One account less; the bank's oldest client is re-read only when it was born on that day
+def remove_client_sql(bank_id, birth_day):
+    return f'''
+            UPDATE Bank_birth_day SET Accounts = Accounts - 1 WHERE Bank_id = {bank_id} AND Birth_day = {birth_day};
+            DELETE FROM Bank_birth_day WHERE Bank_id = {bank_id} AND Birth_day = {birth_day} AND Accounts <= 0;{
+                refresh_oldest_sql(f'= {bank_id}', f'Oldest_birth_day = {birth_day}')}'''
+
+
+# All accounts of a user, grouped by bank, change their client birth date from old_birth_day to new_birth_day
+# (either side may be NULL: a user without a birth date is not counted)
+def move_user_birth_day_sql(user_id, old_birth_day, new_birth_day):
+    user_banks = f'(SELECT Bank_id FROM Account WHERE User_id = {user_id})'
+    return f'''
+            UPDATE Bank_birth_day SET Accounts = Accounts - (
+                SELECT COUNT(*) FROM Account WHERE User_id = {user_id} AND Bank_id = Bank_birth_day.Bank_id)
+            WHERE Birth_day = {old_birth_day} AND Bank_id IN {user_banks};
+            DELETE FROM Bank_birth_day WHERE Birth_day = {old_birth_day} AND Accounts <= 0 AND Bank_id IN {user_banks};
+            INSERT INTO Bank_birth_day (Bank_id, Birth_day, Accounts)
+            SELECT Bank_id, {new_birth_day}, COUNT(*) FROM Account WHERE User_id = {user_id} AND {new_birth_day} IS NOT NULL
+            GROUP BY Bank_id
+            ON CONFLICT (Bank_id, Birth_day) DO UPDATE SET Accounts = Accounts + excluded.Accounts;
+            INSERT INTO Bank_client (Bank_id, Oldest_birth_day)
+            SELECT DISTINCT Bank_id, {new_birth_day} FROM Account WHERE User_id = {user_id} AND {new_birth_day} IS NOT NULL
+            ON CONFLICT (Bank_id) DO UPDATE SET Oldest_birth_day = MIN(Oldest_birth_day, excluded.Oldest_birth_day);{
+                refresh_oldest_sql(f'IN {user_banks}', f'Oldest_birth_day = {old_birth_day}')}'''
+
+
+# Re-read the oldest client of the selected banks matching guard from Bank_birth_day (one seek per bank)
+def refresh_oldest_sql(bank_filter, guard):
+    return f'''
+            DELETE FROM Bank_client WHERE Bank_id {bank_filter} AND {guard}
+                AND NOT EXISTS (SELECT 1 FROM Bank_birth_day WHERE Bank_birth_day.Bank_id = Bank_client.Bank_id);
+            UPDATE Bank_client SET Oldest_birth_day = (
+                SELECT MIN(Birth_day) FROM Bank_birth_day WHERE Bank_birth_day.Bank_id = Bank_client.Bank_id)
+            WHERE Bank_id {bank_filter} AND {guard};'''
+
+
+SUMMARY_TRIGGERS = [
+    f'''
+        CREATE TRIGGER IF NOT EXISTS summary_account_insert AFTER INSERT ON Account
+        WHEN NOT EXISTS (SELECT 1 FROM Summary_suspended WHERE Table_name = 'Account')
+        BEGIN{add_capital_sql('NEW.Bank_id', 'NEW.Currency', 'NEW.Amount', 1)}{
+            add_client_sql('NEW.Bank_id', user_birth_day_sql('NEW.User_id'))}
+        END
+    ''',
+    f'''
+        CREATE TRIGGER IF NOT EXISTS summary_account_delete AFTER DELETE ON Account
+        BEGIN{add_capital_sql('OLD.Bank_id', 'OLD.Currency', '-OLD.Amount', -1)}
+        END
+    ''',
+    f'''
+        CREATE TRIGGER IF NOT EXISTS summary_account_delete_oldest AFTER DELETE ON Account
+        WHEN {user_birth_day_sql('OLD.User_id')} IS NOT NULL
+        BEGIN{remove_client_sql('OLD.Bank_id', user_birth_day_sql('OLD.User_id'))}
+        END
+    ''',
+    '''
+        CREATE TRIGGER IF NOT EXISTS summary_account_amount AFTER UPDATE OF Amount ON Account
+        WHEN OLD.Bank_id = NEW.Bank_id AND OLD.Currency = NEW.Currency
+        BEGIN
+            UPDATE Bank_capital SET Capital = Capital + NEW.Amount - OLD.Amount
+            WHERE Bank_id = NEW.Bank_id AND Currency = NEW.Currency;
+        END
+    ''',
+    f'''
+        CREATE TRIGGER IF NOT EXISTS summary_account_move AFTER UPDATE OF Bank_id, Currency ON Account
+        WHEN OLD.Bank_id != NEW.Bank_id OR OLD.Currency != NEW.Currency
+        BEGIN{add_capital_sql('OLD.Bank_id', 'OLD.Currency', '-OLD.Amount', -1)}{add_capital_sql('NEW.Bank_id', 'NEW.Currency', 'NEW.Amount', 1)}
+        END
+    ''',
+    f'''
+        CREATE TRIGGER IF NOT EXISTS summary_account_owner AFTER UPDATE OF Bank_id, User_id ON Account
+        WHEN OLD.Bank_id != NEW.Bank_id OR OLD.User_id != NEW.User_id
+        BEGIN{remove_client_sql('OLD.Bank_id', user_birth_day_sql('OLD.User_id'))}{
+            add_client_sql('NEW.Bank_id', user_birth_day_sql('NEW.User_id'))}
+        END
+    ''',
+    f'''
+        CREATE TRIGGER IF NOT EXISTS summary_user_birth_day AFTER UPDATE OF Birth_day ON User
+        WHEN OLD.Birth_day IS NOT NEW.Birth_day
+        BEGIN{move_user_birth_day_sql('NEW.id', 'OLD.Birth_day', 'NEW.Birth_day')}
+        END
+    ''',
+    f'''
+        CREATE TRIGGER IF NOT EXISTS summary_user_insert AFTER INSERT ON User
+        WHEN NEW.Birth_day IS NOT NULL AND EXISTS (SELECT 1 FROM Account WHERE User_id = NEW.id)
+        BEGIN{move_user_birth_day_sql('NEW.id', 'NULL', 'NEW.Birth_day')}
+        END
+    ''',
+    f'''
+        CREATE TRIGGER IF NOT EXISTS summary_user_delete AFTER DELETE ON User
+        WHEN OLD.Birth_day IS NOT NULL
+        BEGIN{move_user_birth_day_sql('OLD.id', 'OLD.Birth_day', 'NULL')}
+        END
+    ''',
+]
+
+# Full recompute of the summaries, used by rebuild and verify
+CAPITAL_RECOMPUTE_SQL = '''
+    SELECT Bank_id, Currency, SUM(Amount), COUNT(*) FROM Account GROUP BY Bank_id, Currency
+'''
+BIRTH_DAY_RECOMPUTE_SQL = '''
+    SELECT Account.Bank_id, User.Birth_day, COUNT(*) FROM Account
+    INNER JOIN User ON User.id = Account.User_id
+    WHERE User.Birth_day IS NOT NULL
+    GROUP BY Account.Bank_id, User.Birth_day
+'''
+OLDEST_RECOMPUTE_SQL = '''
+    SELECT Account.Bank_id, MIN(User.Birth_day) FROM Account
+    INNER JOIN User ON User.id = Account.User_id
+    WHERE User.Birth_day IS NOT NULL
+    GROUP BY Account.Bank_id
+'''
+
+
+def rebuild_summaries(cursor):
+    cursor.execute('DELETE FROM Bank_capital')
+    cursor.execute(f'INSERT INTO Bank_capital (Bank_id, Currency, Capital, Account_count) {CAPITAL_RECOMPUTE_SQL}')
+    cursor.execute('DELETE FROM Bank_birth_day')
+    cursor.execute(f'INSERT INTO Bank_birth_day (Bank_id, Birth_day, Accounts) {BIRTH_DAY_RECOMPUTE_SQL}')
+    cursor.execute('DELETE FROM Bank_client')
+    cursor.execute('INSERT INTO Bank_client (Bank_id, Oldest_birth_day) '
+                   'SELECT Bank_id, MIN(Birth_day) FROM Bank_birth_day GROUP BY Bank_id')
+
+
+# Compare the summary tables with a full recompute, returns the rows that differ on either side
+def verify_summaries(cursor):
+    mismatches = {}
+    checks = (
+        ('Bank_capital', 'SELECT Bank_id, Currency, Capital, Account_count FROM Bank_capital', CAPITAL_RECOMPUTE_SQL),
+        ('Bank_birth_day', 'SELECT Bank_id, Birth_day, Accounts FROM Bank_birth_day', BIRTH_DAY_RECOMPUTE_SQL),
+        ('Bank_client', 'SELECT Bank_id, Oldest_birth_day FROM Bank_client', OLDEST_RECOMPUTE_SQL),
+    )
+    for table, stored_sql, recompute_sql in checks:
+        stale = cursor.execute(f'{stored_sql} EXCEPT {recompute_sql}').fetchall()
+        missing = cursor.execute(f'{recompute_sql} EXCEPT {stored_sql}').fetchall()
+        if stale or missing:
+            mismatches[table] = {"stale": stale, "missing": missing}
+    return mismatches
+
+
+# Bulk loads suspend the insert trigger inside their transaction, insert the rows, then add them to the summaries
+# with one grouped statement per table and lift the suspension before the commit. Accounts are selected by
+# account_filter with :last_id, the last id before the load; NOT INDEXED makes a filter on id a rowid range
+# instead of a scan of idx_account_bank in GROUP BY order.
+def add_new_clients_sql(account_filter, accounts='Account'):
+    return [f'''
+        INSERT INTO Bank_birth_day (Bank_id, Birth_day, Accounts)
+        SELECT Account.Bank_id, User.Birth_day, COUNT(*) FROM {accounts}
+        INNER JOIN User ON User.id = Account.User_id
+        WHERE {account_filter} AND User.Birth_day IS NOT NULL
+        GROUP BY Account.Bank_id, User.Birth_day
+        ON CONFLICT (Bank_id, Birth_day) DO UPDATE SET Accounts = Accounts + excluded.Accounts
+    ''', f'''
+        INSERT INTO Bank_client (Bank_id, Oldest_birth_day)
+        SELECT Account.Bank_id, MIN(User.Birth_day) FROM {accounts}
+        INNER JOIN User ON User.id = Account.User_id
+        WHERE {account_filter} AND User.Birth_day IS NOT NULL
+        GROUP BY Account.Bank_id
+        ON CONFLICT (Bank_id) DO UPDATE SET Oldest_birth_day = MIN(Oldest_birth_day, excluded.Oldest_birth_day)
+    ''']
+
+
+BULK_SUMMARY_SQL = {
+    'Account': ['''
+        INSERT INTO Bank_capital (Bank_id, Currency, Capital, Account_count)
+        SELECT Bank_id, Currency, SUM(Amount), COUNT(*) FROM Account NOT INDEXED WHERE id > :last_id
+        GROUP BY Bank_id, Currency
+        ON CONFLICT (Bank_id, Currency) DO UPDATE SET
+            Capital = Capital + excluded.Capital, Account_count = Account_count + excluded.Account_count
+    '''] + add_new_clients_sql('Account.id > :last_id', 'Account NOT INDEXED'),
+}
+
+
+def suspend_summaries(cursor, table):
+    cursor.execute('INSERT INTO Summary_suspended (Table_name) VALUES (?)', (table,))
+    return cursor.execute(f'SELECT COALESCE(MAX(id), 0) FROM {table}').fetchone()[0]
+
+
+def resume_summaries(cursor, table, last_id):
+    for sql in BULK_SUMMARY_SQL[table]:
+        cursor.execute(sql, {"last_id": last_id})
+    cursor.execute('DELETE FROM Summary_suspended WHERE Table_name = ?', (table,))
+
+
+def migrate_to_v3(conn):
+    cursor = conn.cursor()
+    if get_schema_version(cursor) != 2:
+        raise ValueError("Database is not a schema v2 database")
+    conn.commit()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        create_summary_tables(cursor)
+        rebuild_summaries(cursor)
+        cursor.execute('PRAGMA user_version = 3')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return {"banks_summarised": cursor.execute('SELECT COUNT(*) FROM Bank_client').fetchone()[0]}
+
+
+# Schema v4: Account.Discount (percent) and the audit trail of the discount campaigns that set it
+def create_campaign_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS Discount_campaign (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            Name TEXT NOT NULL,
+            Created TEXT NOT NULL,
+            Rules TEXT NOT NULL,
+            Accounts INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS Discount_campaign_account (
+            Campaign_id INTEGER NOT NULL,
+            Account_id INTEGER NOT NULL,
+            Discount INTEGER NOT NULL,
+            Previous_discount INTEGER NOT NULL,
+            PRIMARY KEY (Campaign_id, Account_id),
+            FOREIGN KEY(Campaign_id) REFERENCES Discount_campaign(id)
+        ) WITHOUT ROWID
+    ''')
+
+
+def migrate_to_v4(conn):
+    cursor = conn.cursor()
+    if get_schema_version(cursor) != 3:
+        raise ValueError("Database is not a schema v3 database")
+    conn.commit()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        # Databases migrated from v1 by this version of migrate_to_v2 already have the column
+        added = 'Discount' not in [row[1] for row in cursor.execute('PRAGMA table_info(Account)')]
+        if added:
+            cursor.execute('ALTER TABLE Account ADD COLUMN Discount INTEGER NOT NULL DEFAULT 0')
+        create_campaign_tables(cursor)
+        cursor.execute('PRAGMA user_version = 4')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return {"discount_column_added": added}
+
+
+# Schema v5: the persisted exchange rates read by exchange_rates.py, one row per currency against the base currency
+def create_rates_table(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS Exchange_rate (
+            Currency TEXT PRIMARY KEY,
+            Base_currency TEXT NOT NULL,
+            Rate REAL NOT NULL,
+            Updated_at TEXT NOT NULL
+        )
+    ''')
+
+
+def migrate_to_v5(conn):
+    cursor = conn.cursor()
+    if get_schema_version(cursor) != 4:
+        raise ValueError("Database is not a schema v4 database")
+    conn.commit()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        # Earlier versions of exchange_rates.py created the table on first use, its rows are kept
+        existed = cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'Exchange_rate'").fetchone() is not None
+        create_rates_table(cursor)
+        cursor.execute('PRAGMA user_version = 5')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return {"rates_table_existed": existed}
+
+
+def drop_summary_triggers(cursor):
+    for (name,) in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' "
+                                  "AND name LIKE 'summary_%'").fetchall():
+        cursor.execute(f'DROP TRIGGER {name}')
+
+
+# Replaces the oldest client triggers of v3 with ones that maintain Bank_birth_day
+def migrate_to_v6(conn):
+    cursor = conn.cursor()
+    if get_schema_version(cursor) != 5:
+        raise ValueError("Database is not a schema v5 database")
+    conn.commit()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        drop_summary_triggers(cursor)
+        create_summary_tables(cursor)
+        rebuild_summaries(cursor)
+        cursor.execute('PRAGMA user_version = 6')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return {"birth_day_rows": cursor.execute('SELECT COUNT(*) FROM Bank_birth_day').fetchone()[0]}
+
+
+# Replaces the account insert trigger with one that bulk loads can suspend through Summary_suspended
+def migrate_to_v7(conn):
+    cursor = conn.cursor()
+    if get_schema_version(cursor) != 6:
+        raise ValueError("Database is not a schema v6 database")
+    conn.commit()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        cursor.execute('DROP TRIGGER IF EXISTS summary_account_insert')
+        create_summary_tables(cursor)
+        cursor.execute('PRAGMA user_version = 7')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return {"suspendable_triggers": ["summary_account_insert"]}
+
+
+MIGRATIONS = {1: migrate_to_v2, 2: migrate_to_v3, 3: migrate_to_v4, 4: migrate_to_v5, 5: migrate_to_v6,
+              6: migrate_to_v7}
+
+
+# Run every migration step from the current schema version up to SCHEMA_VERSION
+def migrate(conn):
+    results = {}
+    version = get_schema_version(conn.cursor())
+    while version < SCHEMA_VERSION:
+        results[f"v{version + 1}"] = MIGRATIONS[version](conn)
+        version = get_schema_version(conn.cursor())
+    return results
+
+
+# Report queries as task5_1 ran them against the schema versions its current queries cannot run on (v3 added the
+# summary tables), used for the plans before a migration. From v3 on the queries are task5_1.REPORT_QUERIES.
+REPORT_QUERIES = {
+    1: {
+        'users_with_debts': (
+            'SELECT Name, Surname FROM User INNER JOIN Account ON User.id = Account.User_id WHERE Account.Amount < 0',
+            ()),
+        'bank_with_biggest_capital': (
+            'SELECT Bank.name, SUM(Account.Amount) as total_capital FROM Bank '
+            'INNER JOIN Account ON Bank.id = Account.Bank_id GROUP BY Bank.name ORDER BY total_capital DESC LIMIT 1',
+            ()),
+        'bank_with_oldest_client': (
+            'SELECT Bank.name, MIN(User.Birth_day) as oldest_birth_day FROM Bank '
+            'INNER JOIN Account ON Bank.id = Account.Bank_id INNER JOIN User ON User.id = Account.User_id '
+            'GROUP BY Bank.name ORDER BY oldest_birth_day ASC LIMIT 1',
+            ()),
+        'bank_with_most_unique_users_outbound': (
+            'SELECT Bank.name, COUNT(DISTINCT "Transaction".Account_sender_id) as unique_users FROM Bank '
+            'INNER JOIN Account ON Bank.id = Account.Bank_id '
+            'INNER JOIN "Transaction" ON Account.Account_Number = "Transaction".Account_sender_id '
+            'GROUP BY Bank.name ORDER BY unique_users DESC LIMIT 1',
+            ()),
+        'user_transactions_last_3_months': (
+            'SELECT * FROM "Transaction" WHERE Account_sender_id IN '
+            '(SELECT Account_Number FROM Account WHERE User_id = ?) AND Datetime >= ?',
+            (1, '1970-01-01T00:00:00')),
+    },
+    2: {
+        'users_with_debts': (
+            'SELECT Name, Surname FROM User INNER JOIN Account ON User.id = Account.User_id WHERE Account.Amount < 0',
+            ()),
+        'bank_with_biggest_capital': (
+            'SELECT Bank.name, SUM(Account.Amount) as total_capital FROM Bank '
+            'INNER JOIN Account ON Bank.id = Account.Bank_id GROUP BY Bank.id ORDER BY total_capital DESC LIMIT 1',
+            ()),
+        'bank_with_oldest_client': (
+            'SELECT Bank.name, MIN(User.Birth_day) as oldest_birth_day FROM Bank '
+            'INNER JOIN Account ON Bank.id = Account.Bank_id INNER JOIN User ON User.id = Account.User_id '
+            'GROUP BY Bank.id ORDER BY oldest_birth_day ASC LIMIT 1',
+            ()),
+        'bank_with_most_unique_users_outbound': (
+            'SELECT Bank.name, COUNT(DISTINCT Account.User_id) as unique_users FROM "Transaction" '
+            'INNER JOIN Account ON Account.id = "Transaction".Account_sender_id '
+            'INNER JOIN Bank ON Bank.id = Account.Bank_id GROUP BY Bank.id ORDER BY unique_users DESC LIMIT 1',
+            ()),
+        'user_transactions_last_3_months': (
+            'SELECT * FROM "Transaction" WHERE Account_sender_id IN '
+            '(SELECT id FROM Account WHERE User_id = ?) AND Datetime >= ?',
+            (1, '1970-01-01 00:00:00')),
+    },
+}
+
+
+def report_queries(version):
+    if version in REPORT_QUERIES:
+        return REPORT_QUERIES[version]
+    # Imported here: task5_1 imports this module
+    from task5_1 import REPORT_QUERIES as current_queries
+    return current_queries
+
+
+def explain_queries(cursor, version):
+    plans = {}
+    for name, (sql, params) in report_queries(version).items():
+        plans[name] = [row[3] for row in cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+    return plans
+
+
+def print_query_plans(before, after):
+    for name in after:
+        print(f"\n{name}")
+        print("  before:")
+        for line in before.get(name, []):
+            print(f"    {line}")
+        print("  after:")
+        for line in after[name]:
+            print(f"    {line}")
+
 
 # Main script
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Initial DB setup script.")
     parser.add_argument('--unique-user-fields', action='store_true', help='Enable uniqueness constraint on User.Name and User.Surname')
+    parser.add_argument('--db', default='task3db.db', help='Path to the SQLite database (default: task3db.db)')
+    parser.add_argument('--migrate', action='store_true', help='Migrate an older database to the current schema in place')
+    parser.add_argument('--explain', action='store_true', help='Print the query plans of the report queries')
+    parser.add_argument('--rebuild-summaries', action='store_true', help='Recompute the per-bank summary tables')
+    parser.add_argument('--verify-summaries', action='store_true', help='Check the summary tables against a full recompute')
     args = parser.parse_args()
 
     # Connect to the database
-    conn = sqlite3.connect('task3db.db')
+    conn = sqlite3.connect(args.db)
     cursor = conn.cursor()
 
-    # Create tables
-    create_tables(cursor, args.unique_user_fields)
+    if args.migrate:
+        before = explain_queries(cursor, get_schema_version(cursor))
+        print(migrate(conn))
+        print_query_plans(before, explain_queries(cursor, SCHEMA_VERSION))
+        conn.close()
+        print("Database migrated successfully.")
+    elif args.explain:
+        print_query_plans({}, explain_queries(cursor, get_schema_version(cursor) or SCHEMA_VERSION))
+        conn.close()
+    elif args.rebuild_summaries or args.verify_summaries:
+        if args.rebuild_summaries:
+            rebuild_summaries(cursor)
+            conn.commit()
+            print("Summary tables rebuilt.")
+        mismatches = verify_summaries(cursor)
+        conn.close()
+        print(mismatches if mismatches else "Summary tables match a full recompute.")
+        if mismatches:
+            raise SystemExit(1)
+    else:
+        # Create tables
+        create_tables(cursor, args.unique_user_fields)
 
-    # Commit changes and close connection
-    conn.commit()
-    conn.close()
+        # Commit changes and close connection
+        conn.commit()
+        conn.close()
 
-    print("Database and tables created successfully.")
+        print("Database and tables created successfully.")
@@ -1,58 +1,46 @@
-import sqlite3
 import logging
 import csv
 from functools import wraps
-from datetime import datetime
-import re
-import requests
 import argparse
+from db_pool import ConnectionPool
+from profiling import profiler
+from transfers import apply_transfers, batch_result
+from exchange_rates import ensure_rates
+from task3 import to_minor_units
+from validators import (
+    ACCOUNT_TYPES, ACCOUNT_STATUSES, validate_full_name, validate_account_number, validate_strict_values,
+    validate_users, validate_banks, validate_accounts, validate_csv_users
+)
+from bulk_load import (
+    BULK_CHUNK_SIZE, USER_INSERT_SQL, BANK_INSERT_SQL, ACCOUNT_INSERT_SQL, bulk_insert, bulk_result
+)
 
 logging.basicConfig(level=logging.INFO)
 
+# Pooled connections to the database, see configure_db to change the path or pragmas
+pool = ConnectionPool('task4db.db')
+
+def configure_db(db_path=None, **pragmas):
+    pool.configure(db_path, **pragmas)
+
 # Decorator for database connection
 def db_connection(func):
     @wraps(func)
     def with_connection(*args, **kwargs):
-        conn = sqlite3.connect('task4db.db')
+        conn = pool.acquire()
+        call = profiler.start(f"{func.__module__}.{func.__qualname__}", conn) if profiler.enabled else None
         try:
-            result = func(conn, *args, **kwargs)
+            result = func(call.conn if call else conn, *args, **kwargs)
             conn.commit()
         except Exception as e:
             conn.rollback()
             logging.error(f"Error: {e}")
             result = {"status": "failure", "message": str(e)}
-        finally:
-            conn.close()
+        if call:
+            call.finish()
         return result
     return with_connection
 
-# Validation functions
-def validate_full_name(full_name):
-    clean_name = re.sub(r'[^a-zA-Z\s]', '', full_name)
-    if not clean_name:
-        raise ValueError("Invalid full name")
-    return clean_name.split()
-
-def validate_account_number(account_number):
-    account_number = account_number.replace('#', '-').replace('%', '-').replace('_', '-').replace('?', '-').replace('&', '-')
-    if len(account_number) != 18:
-        raise ValueError("Account number must be 18 characters")
-    if not account_number.startswith("ID--"):
-        raise ValueError("Account number must start with 'ID--'")
-    pattern = r'ID--[a-zA-Z]{1,3}-\d+-'
-    if not re.search(pattern, account_number):
-        raise ValueError("Account number must match the pattern ID--xxx-xxxx-")
-    return account_number
-
-def validate_strict_values(field, value, allowed_values):
-    if value not in allowed_values:
-        raise ValueError(f"Not allowed value '{value}' for field '{field}'")
-
-def validate_transaction_datetime(dt):
-    if not dt:
-        return datetime.now().isoformat()
-    return dt
-
 # Functions to add data
 @db_connection
 def add_user(conn, *user_data):
@@ -85,10 +73,10 @@ def add_account(conn, *account_data):
     for account in account_tuples:
         try:
             account_number = validate_account_number(account[2])
-            validate_strict_values('Type', account[1], ['credit', 'debit'])
-            validate_strict_values('Status', account[6], ['gold', 'silver', 'platinum'])
+            validate_strict_values('Type', account[1], ACCOUNT_TYPES)
+            validate_strict_values('Status', account[6], ACCOUNT_STATUSES)
             cursor.execute("INSERT INTO Account (User_id, Type, Account_Number, Bank_id, Currency, Amount, Status) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                           (account[0], account[1], account_number, account[3], account[4], account[5], account[6]))
+                           (account[0], account[1], account_number, account[3], account[4], to_minor_units(account[5]), account[6]))
         except Exception as e:
             return {"status": "failure", "message": str(e)}
     return {"status": "success", "message": "Accounts added successfully"}
@@ -108,6 +96,26 @@ def add_users_from_csv(conn, csv_path):
     except Exception as e:
         return {"status": "failure", "message": str(e)}
 
+# Bulk load functions: column-wise batch validation, chunked executemany and a per-row rejection report
+@db_connection
+def add_users_bulk(conn, users, chunk_size=BULK_CHUNK_SIZE):
+    return bulk_result("Users", bulk_insert(conn, USER_INSERT_SQL, users, validate_users, chunk_size))
+
+@db_connection
+def add_banks_bulk(conn, banks, chunk_size=BULK_CHUNK_SIZE):
+    return bulk_result("Banks", bulk_insert(conn, BANK_INSERT_SQL, banks, validate_banks, chunk_size))
+
+@db_connection
+def add_accounts_bulk(conn, accounts, chunk_size=BULK_CHUNK_SIZE):
+    report = bulk_insert(conn, ACCOUNT_INSERT_SQL, accounts, validate_accounts, chunk_size, "Account")
+    return bulk_result("Accounts", report)
+
+@db_connection
+def add_users_from_csv_bulk(conn, csv_path, chunk_size=BULK_CHUNK_SIZE):
+    with open(csv_path, mode='r', newline='') as file:
+        report = bulk_insert(conn, USER_INSERT_SQL, csv.DictReader(file), validate_csv_users, chunk_size)
+    return bulk_result("Users from CSV", report)
+
 # Functions to modify and delete data
 @db_connection
 def modify_user(conn, user_id, **kwargs):
@@ -130,54 +138,22 @@ def delete_user(conn, user_id):
         return {"status": "failure", "message": str(e)}
 
 # Money transfer function
-def get_exchange_rate(from_currency, to_currency):
-    api_key = 'your_api_key_here'
-    url = f"https://api.freecurrencyapi.com/v1/latest?apikey={api_key}&base_currency={from_currency}&currencies={to_currency}"
-    response = requests.get(url)
-    if response.status_code == 200:
-        rates = response.json()['data']
-        return rates[to_currency]
-    else:
-        raise Exception("Failed to fetch exchange rate")
-
 @db_connection
 def transfer_money(conn, sender_account_number, receiver_account_number, amount):
-    cursor = conn.cursor()
     try:
-        cursor.execute("SELECT Amount, Currency, User_id FROM Account WHERE Account_Number = ?", (sender_account_number,))
-        sender = cursor.fetchone()
-        if not sender:
-            return {"status": "failure", "message": "Sender account not found"}
-
-        sender_balance, sender_currency, sender_user_id = sender
-
-        if sender_balance < amount:
-            return {"status": "failure", "message": "Insufficient balance"}
-
-        cursor.execute("SELECT Amount, Currency FROM Account WHERE Account_Number = ?", (receiver_account_number,))
-        receiver = cursor.fetchone()
-        if not receiver:
-            return {"status": "failure", "message": "Receiver account not found"}
-
-        receiver_balance, receiver_currency = receiver
-
-        if sender_currency != receiver_currency:
-            exchange_rate = get_exchange_rate(sender_currency, receiver_currency)
-            converted_amount = amount * exchange_rate
-        else:
-            converted_amount = amount
+        return apply_transfers(conn, [(sender_account_number, receiver_account_number, amount)])[0]
+    except Exception as e:
+        return {"status": "failure", "message": str(e)}
 
-        cursor.execute("UPDATE Account SET Amount = Amount - ? WHERE Account_Number = ?", (amount, sender_account_number))
-        cursor.execute("UPDATE Account SET Amount = Amount + ? WHERE Account_Number = ?", (converted_amount, receiver_account_number))
 
-        cursor.execute("""
-            INSERT INTO "Transaction" (Bank_sender_name, Account_sender_id, Bank_receiver_name, Account_receiver_id, Sent_Currency, Sent_Amount, Datetime) 
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, ("SenderBank", sender_user_id, "ReceiverBank", receiver_account_number, sender_currency, amount, datetime.now().isoformat()))
+# Batch transfers: list of (sender_account_number, receiver_account_number, amount), one outcome per transfer
+@db_connection
+def transfer_money_batch(conn, transfers):
+    return batch_result(apply_transfers(conn, transfers))
 
-        return {"status": "success", "message": "Transaction completed successfully"}
-    except Exception as e:
-        return {"status": "failure", "message": str(e)}
+# Exchange rates are loaded (or refreshed) before a write group's transaction starts, see write_queue.WriteService
+transfer_money.prepare_write = ensure_rates
+transfer_money_batch.prepare_write = ensure_rates
 
 # Main script to add initial data
 if __name__ == '__main__':
@@ -189,20 +165,32 @@ if __name__ == '__main__':
     parser.add_argument('--delete-user', type=int, help='Delete a user from the database')
     parser.add_argument('--transfer-money', nargs=3, help='Transfer money between accounts')
     parser.add_argument('--add-users-from-csv', help='Add users from CSV file')
+    parser.add_argument('--transfer-money-batch', help='Apply transfers from a CSV file of sender,receiver,amount rows')
+    parser.add_argument('--bulk', action='store_true', help='Use the bulk load path for --add-* options')
+    parser.add_argument('--chunk-size', type=int, default=BULK_CHUNK_SIZE, help='Rows per transaction in bulk mode')
+    parser.add_argument('--db', default='task4db.db', help='Path to the SQLite database (default: task4db.db)')
+    parser.add_argument('--pragma', action='append', default=[], metavar='NAME=VALUE',
+                        help='Override a connection pragma, e.g. --pragma synchronous=FULL')
+    parser.add_argument('--profile', action='store_true', help='Time every statement and print per-function counters')
+    parser.add_argument('--slow-query-seconds', type=float,
+                        help='Log EXPLAIN QUERY PLAN for statements slower than this (with --profile)')
 
     args = parser.parse_args()
+    configure_db(args.db, **dict(pragma.split('=', 1) for pragma in args.pragma))
+    if args.profile:
+        profiler.enable(args.slow_query_seconds)
 
     if args.add_user:
         users = [tuple(args.add_user[i:i+3]) for i in range(0, len(args.add_user), 3)]
-        print(add_user(*users))
+        print(add_users_bulk(users, args.chunk_size) if args.bulk else add_user(*users))
 
     if args.add_bank:
         banks = [tuple(args.add_bank[i:i+1]) for i in range(0, len(args.add_bank), 1)]
-        print(add_bank(*banks))
+        print(add_banks_bulk(banks, args.chunk_size) if args.bulk else add_bank(*banks))
 
     if args.add_account:
         accounts = [tuple(args.add_account[i:i+7]) for i in range(0, len(args.add_account), 7)]
-        print(add_account(*accounts))
+        print(add_accounts_bulk(accounts, args.chunk_size) if args.bulk else add_account(*accounts))
 
     if args.modify_user:
         user_id = int(args.modify_user[0])
@@ -218,5 +206,15 @@ if __name__ == '__main__':
         amount = float(args.transfer_money[2])
         print(transfer_money(sender_account, receiver_account, amount))
 
+    if args.transfer_money_batch:
+        with open(args.transfer_money_batch, mode='r', newline='') as file:
+            print(transfer_money_batch([tuple(row[:3]) for row in csv.reader(file) if row]))
+
     if args.add_users_from_csv:
-        print(add_users_from_csv(args.add_users_from_csv))
+        if args.bulk:
+            print(add_users_from_csv_bulk(args.add_users_from_csv, args.chunk_size))
+        else:
+            print(add_users_from_csv(args.add_users_from_csv))
+
+    if args.profile:
+        profiler.print_stats()
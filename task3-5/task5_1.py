@@ -1,66 +1,55 @@
-import sqlite3
 import logging
 import csv
 from functools import wraps
-from datetime import datetime, timedelta
-import re
-import requests
+from datetime import datetime, timedelta, timezone
 import random
+from db_pool import ConnectionPool
+from profiling import profiler
+from transfers import apply_transfers, batch_result
+from exchange_rates import ensure_rates
+from discounts import DISCOUNT_VALUES, run_campaign
+from archive import archived_partitions, each_transaction_source, transaction_source
+from pagination import STREAM_BATCH_SIZE, check_page_size, decode_cursor, paginate, iter_rows
+from task3 import to_minor_units, from_minor_units, format_datetime
+from validators import (
+    ACCOUNT_TYPES, ACCOUNT_STATUSES, validate_full_name, validate_account_number, validate_strict_values,
+    validate_users, validate_banks, validate_accounts, validate_csv_users
+)
+from bulk_load import (
+    BULK_CHUNK_SIZE, USER_INSERT_SQL, BANK_INSERT_SQL, ACCOUNT_INSERT_SQL, bulk_insert, bulk_result
+)
 
 logging.basicConfig(level=logging.INFO)
 
 
+# Pooled connections to the database, see configure_db to change the path or pragmas
+pool = ConnectionPool('task5db.db')
+
+
+def configure_db(db_path=None, **pragmas):
+    pool.configure(db_path, **pragmas)
+
+
 # Decorator for database connection
 def db_connection(func):
     @wraps(func)
     def with_connection(*args, **kwargs):
-        conn = sqlite3.connect('task5db.db')
+        conn = pool.acquire()
+        call = profiler.start(f"{func.__module__}.{func.__qualname__}", conn) if profiler.enabled else None
         try:
-            result = func(conn, *args, **kwargs)
+            result = func(call.conn if call else conn, *args, **kwargs)
             conn.commit()
         except Exception as e:
             conn.rollback()
             logging.error(f"Error: {e}")
             result = {"status": "failure", "message": str(e)}
-        finally:
-            conn.close()
+        if call:
+            call.finish()
         return result
 
     return with_connection
 
 
-# Validation functions
-def validate_full_name(full_name):
-    clean_name = re.sub(r'[^a-zA-Z\s]', '', full_name)
-    if not clean_name:
-        raise ValueError("Invalid full name")
-    return clean_name.split()
-
-
-def validate_account_number(account_number):
-    account_number = account_number.replace('#', '-').replace('%', '-').replace('_', '-').replace('?', '-').replace('&',
-                                                                                                                    '-')
-    if len(account_number) != 18:
-        raise ValueError("Account number must be 18 characters")
-    if not account_number.startswith("ID--"):
-        raise ValueError("Account number must start with 'ID--'")
-    pattern = r'ID--[a-zA-Z]{1,3}-\d+-'
-    if not re.search(pattern, account_number):
-        raise ValueError("Account number must match the pattern ID--xxx-xxxx-")
-    return account_number
-
-
-def validate_strict_values(field, value, allowed_values):
-    if value not in allowed_values:
-        raise ValueError(f"Not allowed value '{value}' for field '{field}'")
-
-
-def validate_transaction_datetime(dt):
-    if not dt:
-        return datetime.now().isoformat()
-    return dt
-
-
 # Functions to add data
 @db_connection
 def add_user(conn, *user_data):
@@ -95,11 +84,12 @@ def add_account(conn, *account_data):
     for account in account_tuples:
         try:
             account_number = validate_account_number(account[2])
-            validate_strict_values('Type', account[1], ['credit', 'debit'])
-            validate_strict_values('Status', account[6], ['gold', 'silver', 'platinum'])
+            validate_strict_values('Type', account[1], ACCOUNT_TYPES)
+            validate_strict_values('Status', account[6], ACCOUNT_STATUSES)
             cursor.execute(
                 "INSERT INTO Account (User_id, Type, Account_Number, Bank_id, Currency, Amount, Status) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                (account[0], account[1], account_number, account[3], account[4], account[5], account[6]))
+                (account[0], account[1], account_number, account[3], account[4], to_minor_units(account[5]),
+                 account[6]))
         except Exception as e:
             return {"status": "failure", "message": str(e)}
     return {"status": "success", "message": "Accounts added successfully"}
@@ -121,6 +111,30 @@ def add_users_from_csv(conn, csv_path):
         return {"status": "failure", "message": str(e)}
 
 
+# Bulk load functions: column-wise batch validation, chunked executemany and a per-row rejection report
+@db_connection
+def add_users_bulk(conn, users, chunk_size=BULK_CHUNK_SIZE):
+    return bulk_result("Users", bulk_insert(conn, USER_INSERT_SQL, users, validate_users, chunk_size))
+
+
+@db_connection
+def add_banks_bulk(conn, banks, chunk_size=BULK_CHUNK_SIZE):
+    return bulk_result("Banks", bulk_insert(conn, BANK_INSERT_SQL, banks, validate_banks, chunk_size))
+
+
+@db_connection
+def add_accounts_bulk(conn, accounts, chunk_size=BULK_CHUNK_SIZE):
+    report = bulk_insert(conn, ACCOUNT_INSERT_SQL, accounts, validate_accounts, chunk_size, "Account")
+    return bulk_result("Accounts", report)
+
+
+@db_connection
+def add_users_from_csv_bulk(conn, csv_path, chunk_size=BULK_CHUNK_SIZE):
+    with open(csv_path, mode='r', newline='') as file:
+        report = bulk_insert(conn, USER_INSERT_SQL, csv.DictReader(file), validate_csv_users, chunk_size)
+    return bulk_result("Users from CSV", report)
+
+
 # Functions to modify and delete data
 @db_connection
 def modify_user(conn, user_id, **kwargs):
@@ -145,145 +159,208 @@ def delete_user(conn, user_id):
 
 
 # Money transfer function
-def get_exchange_rate(from_currency, to_currency):
-    api_key = 'your_api_key_here'
-    url = f"https://api.freecurrencyapi.com/v1/latest?apikey={api_key}&base_currency={from_currency}&currencies={to_currency}"
-    response = requests.get(url)
-    if response.status_code == 200:
-        rates = response.json()['data']
-        return rates[to_currency]
-    else:
-        raise Exception("Failed to fetch exchange rate")
-
-
 @db_connection
 def transfer_money(conn, sender_account_number, receiver_account_number, amount):
-    cursor = conn.cursor()
     try:
-        cursor.execute("SELECT Amount, Currency, User_id FROM Account WHERE Account_Number = ?",
-                       (sender_account_number,))
-        sender = cursor.fetchone()
-        if not sender:
-            return {"status": "failure", "message": "Sender account not found"}
-
-        sender_balance, sender_currency, sender_user_id = sender
+        return apply_transfers(conn, [(sender_account_number, receiver_account_number, amount)])[0]
+    except Exception as e:
+        return {"status": "failure", "message": str(e)}
 
-        if sender_balance < amount:
-            return {"status": "failure", "message": "Insufficient balance"}
 
-        cursor.execute("SELECT Amount, Currency FROM Account WHERE Account_Number = ?", (receiver_account_number,))
-        receiver = cursor.fetchone()
-        if not receiver:
-            return {"status": "failure", "message": "Receiver account not found"}
+# Batch transfers: list of (sender_account_number, receiver_account_number, amount), one outcome per transfer
+@db_connection
+def transfer_money_batch(conn, transfers):
+    return batch_result(apply_transfers(conn, transfers))
 
-        receiver_balance, receiver_currency = receiver
 
-        if sender_currency != receiver_currency:
-            exchange_rate = get_exchange_rate(sender_currency, receiver_currency)
-            converted_amount = amount * exchange_rate
-        else:
-            converted_amount = amount
+# Exchange rates are loaded (or refreshed) before a write group's transaction starts, see write_queue.WriteService
+transfer_money.prepare_write = ensure_rates
+transfer_money_batch.prepare_write = ensure_rates
 
-        cursor.execute("UPDATE Account SET Amount = Amount - ? WHERE Account_Number = ?",
-                       (amount, sender_account_number))
-        cursor.execute("UPDATE Account SET Amount = Amount + ? WHERE Account_Number = ?",
-                       (converted_amount, receiver_account_number))
 
-        cursor.execute("""
-            INSERT INTO "Transaction" (Bank_sender_name, Account_sender_id, Bank_receiver_name, Account_receiver_id, Sent_Currency, Sent_Amount, Datetime) 
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, ("SenderBank", sender_user_id, "ReceiverBank", receiver_account_number, sender_currency, amount,
-              datetime.now().isoformat()))
+# New functionalities
 
-        return {"status": "success", "message": "Transaction completed successfully"}
+# Discounts of 25, 30 or 50% for 1 to 10 random users, as one set-based campaign (see discounts.run_campaign).
+# The number of users comes from the seed too, so a seed recorded in the campaign's rules repeats the whole run.
+# data stays {user_id: discount}, the campaign itself is in Discount_campaign.
+@db_connection
+def assign_random_discounts(conn, seed=None):
+    try:
+        seed = random.randrange(2 ** 31) if seed is None else seed % 2 ** 31
+        campaign = run_campaign(conn, "random discounts", DISCOUNT_VALUES, seed,
+                                sample_users=random.Random(seed).randint(1, 10))
+        cursor = conn.execute("""
+            SELECT DISTINCT Account.User_id, c.Discount FROM Discount_campaign_account AS c
+            INNER JOIN Account ON Account.id = c.Account_id
+            WHERE c.Campaign_id = ?
+        """, (campaign["campaign_id"],))
+        return {"status": "success", "message": "Discounts assigned successfully", "data": dict(cursor.fetchall())}
     except Exception as e:
         return {"status": "failure", "message": str(e)}
 
 
-# New functionalities
-
+# Campaign with selection rules, e.g. run_discount_campaign("gold savers", statuses=["gold"], min_balance=1000)
 @db_connection
-def assign_random_discounts(conn):
-    cursor = conn.cursor()
+def run_discount_campaign(conn, name, discounts=DISCOUNT_VALUES, seed=None, **rules):
     try:
-        cursor.execute("SELECT id FROM User")
-        users = cursor.fetchall()
-        selected_users = random.sample(users, k=min(len(users), random.randint(1, 10)))
-        discounts = [25, 30, 50]
-        user_discounts = {user_id[0]: random.choice(discounts) for user_id in selected_users}
-
-        for user_id, discount in user_discounts.items():
-            cursor.execute("UPDATE Account SET Discount = ? WHERE User_id = ?", (discount, user_id))
-
-        return {"status": "success", "message": "Discounts assigned successfully", "data": user_discounts}
+        campaign = run_campaign(conn, name, discounts, seed, **rules)
+        return {"status": "success", "message": "Discount campaign applied successfully", "data": campaign}
     except Exception as e:
         return {"status": "failure", "message": str(e)}
 
 
+# Keyset queries: rows come back in index order, so a page continues right after the last key it returned
+DEBTS_SQL = """
+    SELECT Account.id, User.Name, User.Surname FROM Account
+    INNER JOIN User ON User.id = Account.User_id
+    WHERE Account.Amount < 0 AND Account.id > ?
+    ORDER BY Account.id
+"""
+DEBTS_PAGE_SQL = DEBTS_SQL + " LIMIT ?"
+
+
 @db_connection
-def users_with_debts(conn):
+def users_with_debts(conn, page_size=None, continuation=None):
     cursor = conn.cursor()
     try:
-        cursor.execute(
-            "SELECT Name, Surname FROM User INNER JOIN Account ON User.id = Account.User_id WHERE Account.Amount < 0")
-        users = cursor.fetchall()
-        full_names = [f"{name} {surname}" for name, surname in users]
-        return {"status": "success", "message": "Users with debts fetched successfully", "data": full_names}
+        if page_size is None:
+            cursor.execute(DEBTS_SQL, (0,))
+            full_names = [f"{name} {surname}" for _, name, surname in cursor.fetchall()]
+            return {"status": "success", "message": "Users with debts fetched successfully", "data": full_names}
+
+        check_page_size(page_size)
+        after = decode_cursor(continuation) or [0]
+        cursor.execute(DEBTS_PAGE_SQL, (after[0], page_size + 1))
+        rows, next_token = paginate(cursor.fetchall(), page_size, key=lambda row: (row[0],))
+        return {"status": "success", "message": "Users with debts fetched successfully",
+                "data": [f"{name} {surname}" for _, name, surname in rows], "next": next_token}
     except Exception as e:
         return {"status": "failure", "message": str(e)}
 
 
+# Streams run on a connection of their own: the generator can be left open for as long as the caller likes, and
+# its cursor (and, for transactions, attached archive partitions) must not stay on the thread's pooled connection
+def stream_users_with_debts(batch_size=STREAM_BATCH_SIZE):
+    conn = pool.connect()
+    try:
+        for _, name, surname in iter_rows(conn.execute(DEBTS_SQL, (0,)), batch_size):
+            yield f"{name} {surname}"
+    finally:
+        pool.release(conn)
+
+
+BIGGEST_CAPITAL_SQL = """
+    SELECT Bank.name, SUM(Bank_capital.Capital) as total_capital
+    FROM Bank_capital
+    INNER JOIN Bank ON Bank.id = Bank_capital.Bank_id
+    GROUP BY Bank_capital.Bank_id
+    ORDER BY total_capital DESC
+    LIMIT 1
+"""
+
+
 @db_connection
 def bank_with_biggest_capital(conn):
     cursor = conn.cursor()
     try:
-        cursor.execute("""
-            SELECT Bank.name, SUM(Account.Amount) as total_capital
-            FROM Bank
-            INNER JOIN Account ON Bank.id = Account.Bank_id
-            GROUP BY Bank.name
-            ORDER BY total_capital DESC
-            LIMIT 1
-        """)
+        cursor.execute(BIGGEST_CAPITAL_SQL)
         bank = cursor.fetchone()
+        if bank:
+            bank = (bank[0], from_minor_units(bank[1]))
         return {"status": "success", "message": "Bank with biggest capital fetched successfully", "data": bank}
     except Exception as e:
         return {"status": "failure", "message": str(e)}
 
 
+OLDEST_CLIENT_SQL = """
+    SELECT Bank.name, Bank_client.Oldest_birth_day
+    FROM Bank_client
+    INNER JOIN Bank ON Bank.id = Bank_client.Bank_id
+    ORDER BY Bank_client.Oldest_birth_day ASC
+    LIMIT 1
+"""
+
+
 @db_connection
 def bank_with_oldest_client(conn):
     cursor = conn.cursor()
     try:
-        cursor.execute("""
-            SELECT Bank.name, MIN(User.Birth_day) as oldest_birth_day
-            FROM Bank
-            INNER JOIN Account ON Bank.id = Account.Bank_id
-            INNER JOIN User ON User.id = Account.User_id
-            GROUP BY Bank.name
-            ORDER BY oldest_birth_day ASC
-            LIMIT 1
-        """)
+        cursor.execute(OLDEST_CLIENT_SQL)
         bank = cursor.fetchone()
         return {"status": "success", "message": "Bank with oldest client fetched successfully", "data": bank}
     except Exception as e:
         return {"status": "failure", "message": str(e)}
 
 
+CAPITAL_BY_CURRENCY_SQL = """
+    SELECT Bank.name, Bank_capital.Currency, Bank_capital.Capital, Bank_capital.Account_count
+    FROM Bank_capital
+    INNER JOIN Bank ON Bank.id = Bank_capital.Bank_id
+    ORDER BY Bank.name, Bank_capital.Currency
+"""
+
+
 @db_connection
-def bank_with_most_unique_users_outbound(conn):
+def bank_capital_by_currency(conn):
     cursor = conn.cursor()
     try:
-        cursor.execute("""
-            SELECT Bank.name, COUNT(DISTINCT Transaction.Account_sender_id) as unique_users
-            FROM Bank
-            INNER JOIN Account ON Bank.id = Account.Bank_id
-            INNER JOIN Transaction ON Account.Account_Number = Transaction.Account_sender_id
-            GROUP BY Bank.name
-            ORDER BY unique_users DESC
-            LIMIT 1
-        """)
-        bank = cursor.fetchone()
+        cursor.execute(CAPITAL_BY_CURRENCY_SQL)
+        capital = [(name, currency, from_minor_units(amount), count) for name, currency, amount, count in cursor.fetchall()]
+        return {"status": "success", "message": "Bank capital by currency fetched successfully", "data": capital}
+    except Exception as e:
+        return {"status": "failure", "message": str(e)}
+
+
+OUTBOUND_SQL = """
+    SELECT Bank.name, COUNT(DISTINCT Account.User_id) as unique_users
+    FROM "Transaction"
+    INNER JOIN Account ON Account.id = "Transaction".Account_sender_id
+    INNER JOIN Bank ON Bank.id = Account.Bank_id
+    WHERE "Transaction".Datetime >= ?
+    GROUP BY Bank.id
+    ORDER BY unique_users DESC
+    LIMIT 1
+"""
+
+# Used when the range reaches archived months: distinct (bank, user) pairs of every source, then one count per bank
+OUTBOUND_PAIRS_SQL = """
+    INSERT OR IGNORE INTO temp.outbound_pairs (Bank_id, User_id)
+    SELECT DISTINCT Account.Bank_id, Account.User_id
+    FROM {transactions} AS t
+    INNER JOIN main.Account ON Account.id = t.Account_sender_id
+    WHERE t.Datetime >= ?
+"""
+
+OUTBOUND_FROM_PAIRS_SQL = """
+    SELECT Bank.name, COUNT(*) as unique_users
+    FROM temp.outbound_pairs
+    INNER JOIN Bank ON Bank.id = outbound_pairs.Bank_id
+    GROUP BY outbound_pairs.Bank_id
+    ORDER BY unique_users DESC
+    LIMIT 1
+"""
+
+
+@db_connection
+def bank_with_most_unique_users_outbound(conn, since=None):
+    cursor = conn.cursor()
+    try:
+        if not archived_partitions(conn, since):
+            cursor.execute(OUTBOUND_SQL, (since or '',))
+            bank = cursor.fetchone()
+        else:
+            cursor.execute("CREATE TEMP TABLE IF NOT EXISTS outbound_pairs "
+                           "(Bank_id INTEGER, User_id INTEGER, PRIMARY KEY (Bank_id, User_id)) WITHOUT ROWID")
+            try:
+                # each_transaction_source refuses to start inside a caller's transaction, so the one each INSERT opens
+                # is this report's own and only holds temp rows; it ends before the partition is detached
+                for source in each_transaction_source(conn, since):
+                    cursor.execute(OUTBOUND_PAIRS_SQL.format(transactions=source), (since or '',))
+                    conn.commit()
+                cursor.execute(OUTBOUND_FROM_PAIRS_SQL)
+                bank = cursor.fetchone()
+            finally:
+                cursor.execute("DROP TABLE temp.outbound_pairs")
         return {"status": "success", "message": "Bank with most unique users outbound fetched successfully",
                 "data": bank}
     except Exception as e:
@@ -303,18 +380,93 @@ def delete_incomplete_users_and_accounts(conn):
         return {"status": "failure", "message": str(e)}
 
 
+USER_TRANSACTIONS_SQL = """
+    SELECT id, Bank_sender_name, Account_sender_id, Bank_receiver_name, Account_receiver_id,
+           Sent_Currency, Sent_Amount, Datetime
+    FROM {transactions}
+    WHERE Account_sender_id IN (SELECT id FROM Account WHERE User_id = ?)
+    AND Datetime >= ?
+    ORDER BY Account_sender_id, Datetime, id
+"""
+
+# One account at a time, so a page seeks straight to its (Datetime, id) key in idx_transaction_sender
+ACCOUNT_TRANSACTIONS_PAGE_SQL = """
+    SELECT id, Bank_sender_name, Account_sender_id, Bank_receiver_name, Account_receiver_id,
+           Sent_Currency, Sent_Amount, Datetime
+    FROM {transactions}
+    WHERE Account_sender_id = ? AND (Datetime, id) > (?, ?)
+    ORDER BY Datetime, id
+    LIMIT ?
+"""
+
+
+def transaction_row(row):
+    return row[:6] + (from_minor_units(row[6]), row[7])
+
+
+def three_months_ago():
+    return format_datetime(datetime.now(timezone.utc) - timedelta(days=90))
+
+
+# Archived months are attached and unioned in only when the 3 month window reaches past the archive cutoff
 @db_connection
-def user_transactions_last_3_months(conn, user_id):
+def user_transactions_last_3_months(conn, user_id, page_size=None, continuation=None):
     cursor = conn.cursor()
     try:
-        three_months_ago = datetime.now() - timedelta(days=90)
-        cursor.execute("""
-            SELECT * FROM Transaction 
-            WHERE Account_sender_id IN (SELECT Account_Number FROM Account WHERE User_id = ?)
-            AND Datetime >= ?
-        """, (user_id, three_months_ago.isoformat()))
-        transactions = cursor.fetchall()
+        if page_size is not None:
+            check_page_size(page_size)
+        since = three_months_ago()
+        with transaction_source(conn, since) as source:
+            if page_size is None:
+                cursor.execute(USER_TRANSACTIONS_SQL.format(transactions=source), (user_id, since))
+                transactions = [transaction_row(row) for row in cursor.fetchall()]
+                return {"status": "success", "message": "User transactions for last 3 months fetched successfully",
+                        "data": transactions}
+
+            # Continuation key: (Account_sender_id, Datetime, id) of the last returned transaction
+            after = decode_cursor(continuation) or [0, since, 0]
+            cursor.execute("SELECT id FROM Account WHERE User_id = ? AND id >= ? ORDER BY id", (user_id, after[0]))
+            account_ids = [row[0] for row in cursor.fetchall()]
+            page_sql = ACCOUNT_TRANSACTIONS_PAGE_SQL.format(transactions=source)
+            rows = []
+            for account_id in account_ids:
+                bound = max((since, 0), (after[1], after[2])) if account_id == after[0] else (since, 0)
+                cursor.execute(page_sql, (account_id, bound[0], bound[1], page_size + 1 - len(rows)))
+                rows.extend(cursor.fetchall())
+                if len(rows) > page_size:
+                    break
+        rows, next_token = paginate(rows, page_size, key=lambda row: (row[2], row[7], row[0]))
         return {"status": "success", "message": "User transactions for last 3 months fetched successfully",
-                "data": transactions}
+                "data": [transaction_row(row) for row in rows], "next": next_token}
     except Exception as e:
         return {"status": "failure", "message": str(e)}
+
+
+def stream_user_transactions_last_3_months(user_id, batch_size=STREAM_BATCH_SIZE):
+    conn = pool.connect()
+    try:
+        since = three_months_ago()
+        with transaction_source(conn, since) as source:
+            cursor = conn.execute(USER_TRANSACTIONS_SQL.format(transactions=source), (user_id, since))
+            try:
+                for row in iter_rows(cursor, batch_size):
+                    yield transaction_row(row)
+            finally:
+                cursor.close()
+    finally:
+        pool.release(conn)
+
+
+# The report queries as they run against the hot tables, with sample parameters. task3.py --explain prints their plans.
+REPORT_QUERIES = {
+    'users_with_debts': (DEBTS_SQL, (0,)),
+    'users_with_debts_page': (DEBTS_PAGE_SQL, (0, 100)),
+    'bank_with_biggest_capital': (BIGGEST_CAPITAL_SQL, ()),
+    'bank_with_oldest_client': (OLDEST_CLIENT_SQL, ()),
+    'bank_capital_by_currency': (CAPITAL_BY_CURRENCY_SQL, ()),
+    'bank_with_most_unique_users_outbound': (OUTBOUND_SQL, ('1970-01-01 00:00:00',)),
+    'user_transactions_last_3_months': (USER_TRANSACTIONS_SQL.format(transactions='"Transaction"'),
+                                        (1, '1970-01-01 00:00:00')),
+    'user_transactions_last_3_months_page': (ACCOUNT_TRANSACTIONS_PAGE_SQL.format(transactions='"Transaction"'),
+                                             (1, '1970-01-01 00:00:00', 0, 100)),
+}
@@ -1,49 +1,59 @@
 import logging
+import argparse
 from task5_1 import (
-    add_user, add_bank, add_account, modify_user, delete_user, transfer_money,
+    add_user, add_bank, add_account, modify_user, delete_user, transfer_money, configure_db,
     assign_random_discounts, users_with_debts, bank_with_biggest_capital,
     bank_with_oldest_client, bank_with_most_unique_users_outbound,
     delete_incomplete_users_and_accounts, user_transactions_last_3_months
 )
+from profiling import profiler
+from report_runner import REPORT_TIMEOUT, REPORT_WORKERS, run_reports, print_timing_table
 
 logging.basicConfig(level=logging.INFO)
 
-def main():
+def main(db_path='task5db.db', workers=REPORT_WORKERS, snapshot=False, timeout=REPORT_TIMEOUT):
+    configure_db(db_path)
+
+    # Writes run alone, before and after the parallel read-only phase
     try:
         logging.info(assign_random_discounts())
     except Exception as e:
         logging.error(f"Error in assigning discounts: {e}")
 
+    user_id = 1  # Replace with an actual user ID
+    reports = [
+        ("users_with_debts", users_with_debts, ()),
+        ("bank_with_biggest_capital", bank_with_biggest_capital, ()),
+        ("bank_with_oldest_client", bank_with_oldest_client, ()),
+        ("bank_with_most_unique_users_outbound", bank_with_most_unique_users_outbound, ()),
+        ("user_transactions_last_3_months", user_transactions_last_3_months, (user_id,)),
+    ]
     try:
-        logging.info(users_with_debts())
-    except Exception as e:
-        logging.error(f"Error in fetching users with debts: {e}")
-
-    try:
-        logging.info(bank_with_biggest_capital())
-    except Exception as e:
-        logging.error(f"Error in fetching bank with biggest capital: {e}")
-
-    try:
-        logging.info(bank_with_oldest_client())
+        results = run_reports(db_path, reports, workers=workers, snapshot=snapshot, timeout=timeout)
+        for name, (result, elapsed) in results.items():
+            logging.info(f"{name}: {result}")
+        print_timing_table(results)
     except Exception as e:
-        logging.error(f"Error in fetching bank with oldest client: {e}")
-
-    try:
-        logging.info(bank_with_most_unique_users_outbound())
-    except Exception as e:
-        logging.error(f"Error in fetching bank with most unique users outbound: {e}")
+        logging.error(f"Error in running reports: {e}")
 
     try:
         logging.info(delete_incomplete_users_and_accounts())
     except Exception as e:
         logging.error(f"Error in deleting incomplete users and accounts: {e}")
 
-    try:
-        user_id = 1  # Replace with an actual user ID
-        logging.info(user_transactions_last_3_months(user_id))
-    except Exception as e:
-        logging.error(f"Error in fetching user transactions: {e}")
-
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Run the task5 jobs, read-only reports in parallel.")
+    parser.add_argument('--db', default='task5db.db')
+    parser.add_argument('--workers', type=int, default=REPORT_WORKERS, help='Parallel read-only report connections')
+    parser.add_argument('--snapshot', action='store_true',
+                        help='Run every report against one backup copy so they all see the same state')
+    parser.add_argument('--timeout', type=float, default=REPORT_TIMEOUT, help='Seconds before a report is interrupted')
+    parser.add_argument('--profile', action='store_true', help='Time every statement and print per-function counters')
+    parser.add_argument('--slow-query-seconds', type=float,
+                        help='Log EXPLAIN QUERY PLAN for statements slower than this (with --profile)')
+    args = parser.parse_args()
+    if args.profile:
+        profiler.enable(args.slow_query_seconds)
+    main(args.db, args.workers, args.snapshot, args.timeout)
+    if args.profile:
+        profiler.print_stats()
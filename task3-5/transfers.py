@@ -0,0 +1,116 @@
+from decimal import InvalidOperation
+from exchange_rates import get_exchange_rate
+from task3 import to_minor_units, format_datetime
+
+# Account numbers per IN (...) lookup, stays below SQLite's bound parameter limit
+RESOLVE_CHUNK_SIZE = 500
+
+TRANSACTION_INSERT_SQL = """
+    INSERT INTO "Transaction" (Bank_sender_name, Account_sender_id, Bank_receiver_name, Account_receiver_id,
+                               Sent_Currency, Sent_Amount, Datetime)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+# Map account numbers to (id, currency, bank name) with a few bulk queries
+def resolve_accounts(conn, account_numbers):
+    numbers = list(set(account_numbers))
+    accounts = {}
+    for start in range(0, len(numbers), RESOLVE_CHUNK_SIZE):
+        chunk = numbers[start:start + RESOLVE_CHUNK_SIZE]
+        placeholders = ', '.join('?' * len(chunk))
+        rows = conn.execute(f"""
+            SELECT Account.Account_Number, Account.id, Account.Currency, COALESCE(Bank.name, '') FROM Account
+            LEFT JOIN Bank ON Bank.id = Account.Bank_id WHERE Account.Account_Number IN ({placeholders})
+        """, chunk)
+        for number, account_id, currency, bank_name in rows:
+            accounts[number] = (account_id, currency, bank_name)
+    return accounts
+
+
+def failure(message):
+    return {"status": "failure", "message": message}
+
+
+# Plan every transfer before the write lock is taken: account lookups, amount parsing and exchange rates.
+# A malformed transfer only fails its own outcome.
+def plan_transfers(conn, transfers):
+    outcomes = [None] * len(transfers)
+    parsed = []
+    for index, transfer in enumerate(transfers):
+        try:
+            sender_number, receiver_number, amount = transfer
+        except (TypeError, ValueError):
+            outcomes[index] = failure(f"Transfer must be (sender account, receiver account, amount), got {transfer!r}")
+            continue
+        parsed.append((index, sender_number, receiver_number, amount))
+
+    accounts = resolve_accounts(conn, [number for _, sender, receiver, _ in parsed for number in (sender, receiver)])
+    planned = []
+    for index, sender_number, receiver_number, amount in parsed:
+        sender = accounts.get(sender_number)
+        if not sender:
+            outcomes[index] = failure("Sender account not found")
+            continue
+        receiver = accounts.get(receiver_number)
+        if not receiver:
+            outcomes[index] = failure("Receiver account not found")
+            continue
+        try:
+            minor_amount = to_minor_units(amount)
+        except (InvalidOperation, TypeError, ValueError):
+            outcomes[index] = failure(f"Invalid amount '{amount}'")
+            continue
+        try:
+            if minor_amount <= 0:
+                raise ValueError("Transfer amount must be positive")
+            converted_amount = minor_amount
+            if sender[1] != receiver[1]:
+                converted_amount = round(minor_amount * get_exchange_rate(conn, sender[1], receiver[1]))
+        except Exception as e:
+            outcomes[index] = failure(str(e))
+            continue
+        planned.append((index, sender, receiver, minor_amount, converted_amount))
+    return planned, outcomes
+
+
+# Apply (sender_account_number, receiver_account_number, amount) transfers in one BEGIN IMMEDIATE transaction.
+# The debit is a conditional UPDATE, so the balance check and the write cannot be interleaved by other writers.
+def apply_transfers(conn, transfers):
+    transfers = list(transfers)
+    planned, outcomes = plan_transfers(conn, transfers)
+    if not planned:
+        return outcomes
+
+    timestamp = format_datetime()
+    transaction_rows = []
+    owns_transaction = not conn.in_transaction
+    if owns_transaction:
+        conn.execute('BEGIN IMMEDIATE')
+    try:
+        for index, sender, receiver, amount, converted_amount in planned:
+            debit = conn.execute("UPDATE Account SET Amount = Amount - ? WHERE id = ? AND Amount >= ?",
+                                 (amount, sender[0], amount))
+            if debit.rowcount == 0:
+                outcomes[index] = failure("Insufficient balance")
+                continue
+            credit = conn.execute("UPDATE Account SET Amount = Amount + ? WHERE id = ?", (converted_amount, receiver[0]))
+            if credit.rowcount == 0:
+                conn.execute("UPDATE Account SET Amount = Amount + ? WHERE id = ?", (amount, sender[0]))
+                outcomes[index] = failure("Receiver account not found")
+                continue
+            transaction_rows.append((sender[2], sender[0], receiver[2], receiver[0], sender[1], amount, timestamp))
+            outcomes[index] = {"status": "success", "message": "Transaction completed successfully"}
+        conn.executemany(TRANSACTION_INSERT_SQL, transaction_rows)
+        if owns_transaction:
+            conn.commit()
+    except Exception:
+        if owns_transaction:
+            conn.rollback()
+        raise
+    return outcomes
+
+
+def batch_result(outcomes):
+    completed = sum(1 for outcome in outcomes if outcome["status"] == "success")
+    return {"status": "success", "message": f"{completed} of {len(outcomes)} transfers completed", "data": outcomes}
@@ -0,0 +1,196 @@
+import re
+from task3 import to_minor_units, format_datetime
+
+ACCOUNT_NUMBER_LENGTH = 18
+ACCOUNT_NUMBER_PREFIX = 'ID--'
+ACCOUNT_TYPES = frozenset(['credit', 'debit'])
+ACCOUNT_STATUSES = frozenset(['gold', 'silver', 'platinum'])
+
+# Compiled once at import instead of going through the re cache on every call
+NAME_JUNK = re.compile(r'[^a-zA-Z\s]')
+# Same cleanup as NAME_JUNK for ASCII text, which is most names, without going through the regex engine
+NAME_JUNK_ASCII = str.maketrans('', '', ''.join(char for char in map(chr, range(128))
+                                                if not (char.isalpha() or char.isspace())))
+ACCOUNT_NUMBER_PATTERN = re.compile(r'ID--[a-zA-Z]{1,3}-\d+-')
+PLAIN_AMOUNT = re.compile(r'-?[0-9]+(\.[0-9]{1,2})?')
+# One pass replaces every separator variant with '-'
+ACCOUNT_NUMBER_SEPARATORS = str.maketrans('#%_?&', '-----')
+
+# Exceptions a bad input value can raise, decimal.InvalidOperation from to_minor_units is an ArithmeticError
+VALIDATION_ERRORS = (ValueError, TypeError, KeyError, IndexError, AttributeError, ArithmeticError)
+
+
+def clean_full_name(text):
+    return text.translate(NAME_JUNK_ASCII) if text.isascii() else NAME_JUNK.sub('', text)
+
+
+# Single value validators
+def validate_full_name(full_name):
+    clean_name = clean_full_name(full_name)
+    if not clean_name:
+        raise ValueError("Invalid full name")
+    return clean_name.split()
+
+
+def validate_account_number(account_number):
+    account_number = account_number.translate(ACCOUNT_NUMBER_SEPARATORS)
+    if len(account_number) != ACCOUNT_NUMBER_LENGTH:
+        raise ValueError("Account number must be 18 characters")
+    if not account_number.startswith(ACCOUNT_NUMBER_PREFIX):
+        raise ValueError("Account number must start with 'ID--'")
+    if not ACCOUNT_NUMBER_PATTERN.search(account_number):
+        raise ValueError("Account number must match the pattern ID--xxx-xxxx-")
+    return account_number
+
+
+def validate_strict_values(field, value, allowed_values):
+    if value not in allowed_values:
+        raise ValueError(f"Not allowed value '{value}' for field '{field}'")
+
+
+def validate_transaction_datetime(dt):
+    if not dt:
+        return format_datetime()
+    return dt
+
+
+# Column validators: a column of strings is joined and cleaned with one regex or translate call over the whole
+# text, then checked with one comprehension; only values failing the fast check go through the single value
+# validator again, which decides whether they are really invalid and with which message.
+# Each returns the cleaned column and {index: message}.
+def transform_column(values, transform):
+    try:
+        text = '\n'.join(values)
+    except TypeError:
+        return None
+    # A value containing the separator would shift every value after it
+    if text.count('\n') != len(values) - 1:
+        return None
+    return transform(text).split('\n') if values else []
+
+
+def full_name_column(values):
+    cleaned = transform_column(values, clean_full_name)
+    if cleaned is None:
+        cleaned = [clean_full_name(value) if type(value) is str else '' for value in values]
+    names = [value.split() for value in cleaned]
+    # Same message as validate_full_name when nothing is left after cleaning
+    return names, {index: "Full name must be a name and a surname" if cleaned[index] else "Invalid full name"
+                   for index, name in enumerate(names) if len(name) != 2}
+
+
+def account_number_column(values):
+    numbers = transform_column(values, lambda text: text.translate(ACCOUNT_NUMBER_SEPARATORS))
+    if numbers is None:
+        numbers = [value.translate(ACCOUNT_NUMBER_SEPARATORS) if type(value) is str else value for value in values]
+    # An 18 character number matching the pattern at its start passes all three checks of validate_account_number
+    match = ACCOUNT_NUMBER_PATTERN.match
+    suspects = [index for index, number in enumerate(numbers)
+                if not (type(number) is str and len(number) == ACCOUNT_NUMBER_LENGTH and match(number))]
+    errors = {}
+    for index in suspects:
+        message = account_number_error(values[index])
+        if message:
+            errors[index] = message
+    return numbers, errors
+
+
+def account_number_error(value):
+    try:
+        validate_account_number(value)
+    except VALIDATION_ERRORS as e:
+        return str(e)
+
+
+def strict_column(field, values, allowed_values):
+    return {index: f"Not allowed value '{value}' for field '{field}'"
+            for index, value in enumerate(values) if value not in allowed_values}
+
+
+# Plain amounts with at most two decimals are exact in minor units, anything else goes through to_minor_units
+def amount_column(values):
+    plain = PLAIN_AMOUNT.fullmatch
+    amounts, errors = [], {}
+    for index, value in enumerate(values):
+        text = value if type(value) is str else str(value)
+        if plain(text):
+            whole, _, cents = text.partition('.')
+            amounts.append(int(whole + cents.ljust(2, '0')))
+            continue
+        try:
+            amounts.append(to_minor_units(value))
+        except VALIDATION_ERRORS:
+            amounts.append(None)
+            errors[index] = f"Invalid amount '{value}'"
+    return amounts, errors
+
+
+# Pull one field out of every row, rows too short or missing the key get an error instead
+def column(rows, key, field, errors):
+    try:
+        return [row[key] for row in rows]
+    except VALIDATION_ERRORS:
+        values = []
+        for index, row in enumerate(rows):
+            try:
+                values.append(row[key])
+            except VALIDATION_ERRORS:
+                values.append(None)
+                errors.setdefault(index, (field, f"Missing field '{field}'"))
+        return values
+
+
+def merge_errors(errors, field, column_errors):
+    for index, message in column_errors.items():
+        errors.setdefault(index, (field, message))
+
+
+# Rows that passed every column, numbered from `start`, plus structured errors (first failing field per row)
+def batch_result(start, errors, *columns):
+    valid = [(start + index, params) for index, params in enumerate(zip(*columns)) if index not in errors]
+    rejected = [{"row": start + index, "field": field, "error": message}
+                for index, (field, message) in sorted(errors.items())]
+    return valid, rejected
+
+
+# Batch API: validate a list of (full_name, birth_day, accounts) tuples or user CSV rows at once.
+# Returns ([(row_number, insert parameters), ...], [{"row", "field", "error"}, ...]).
+def validate_users(rows, start=1, keys=(0, 1, 2)):
+    rows = list(rows)
+    errors = {}
+    full_names = column(rows, keys[0], 'user_full_name', errors)
+    birth_days = column(rows, keys[1], 'birth_day', errors)
+    accounts = column(rows, keys[2], 'accounts', errors)
+    names, name_errors = full_name_column(full_names)
+    merge_errors(errors, 'user_full_name', name_errors)
+    first_names = [name[0] if len(name) == 2 else None for name in names]
+    surnames = [name[1] if len(name) == 2 else None for name in names]
+    return batch_result(start, errors, first_names, surnames, birth_days, accounts)
+
+
+def validate_csv_users(rows, start=1):
+    return validate_users(rows, start, keys=('user_full_name', 'birth_day', 'accounts'))
+
+
+def validate_banks(rows, start=1):
+    rows = list(rows)
+    errors = {}
+    names = column(rows, 0, 'name', errors)
+    merge_errors(errors, 'name', {index: "Invalid bank name" for index, name in enumerate(names) if not name})
+    return batch_result(start, errors, names)
+
+
+# (User_id, Type, Account_Number, Bank_id, Currency, Amount, Status) tuples, checked in the order of add_account
+def validate_accounts(rows, start=1):
+    rows = list(rows)
+    errors = {}
+    user_ids, types, raw_numbers, bank_ids, currencies, raw_amounts, statuses = (
+        column(rows, key, field, errors) for key, field in
+        enumerate(['User_id', 'Type', 'Account_Number', 'Bank_id', 'Currency', 'Amount', 'Status']))
+    numbers, number_errors = account_number_column(raw_numbers)
+    merge_errors(errors, 'Account_Number', number_errors)
+    merge_errors(errors, 'Type', strict_column('Type', types, ACCOUNT_TYPES))
+    merge_errors(errors, 'Status', strict_column('Status', statuses, ACCOUNT_STATUSES))
+    amounts, amount_errors = amount_column(raw_amounts)
+    merge_errors(errors, 'Amount', amount_errors)
+    return batch_result(start, errors, user_ids, types, numbers, bank_ids, currencies, amounts, statuses)
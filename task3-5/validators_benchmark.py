@@ -0,0 +1,113 @@
+import re
+import time
+import random
+import argparse
+from bulk_load import BULK_CHUNK_SIZE
+from task3 import to_minor_units
+from validators import (
+    ACCOUNT_NUMBER_LENGTH, VALIDATION_ERRORS, validate_strict_values, validate_users, validate_accounts
+)
+
+
+# The validators as they were before validators.py, kept only for the benchmark below
+def legacy_validate_full_name(full_name):
+    clean_name = re.sub(r'[^a-zA-Z\s]', '', full_name)
+    if not clean_name:
+        raise ValueError("Invalid full name")
+    return clean_name.split()
+
+
+def legacy_validate_account_number(account_number):
+    account_number = account_number.replace('#', '-').replace('%', '-').replace('_', '-').replace('?', '-').replace('&', '-')
+    if len(account_number) != 18:
+        raise ValueError("Account number must be 18 characters")
+    if not account_number.startswith("ID--"):
+        raise ValueError("Account number must start with 'ID--'")
+    pattern = r'ID--[a-zA-Z]{1,3}-\d+-'
+    if not re.search(pattern, account_number):
+        raise ValueError("Account number must match the pattern ID--xxx-xxxx-")
+    return account_number
+
+
+def legacy_prepare_account(account):
+    account_number = legacy_validate_account_number(account[2])
+    validate_strict_values('Type', account[1], ['credit', 'debit'])
+    validate_strict_values('Status', account[6], ['gold', 'silver', 'platinum'])
+    return account[0], account[1], account_number, account[3], account[4], to_minor_units(account[5]), account[6]
+
+
+def legacy_prepare_user(user):
+    name, surname = legacy_validate_full_name(user[0])
+    return name, surname, user[1], user[2]
+
+
+def legacy_validate_rows(rows, prepare, start=1):
+    valid, rejected = [], []
+    for row_number, row in enumerate(rows, start=start):
+        try:
+            valid.append((row_number, prepare(row)))
+        except VALIDATION_ERRORS as e:
+            rejected.append({"row": row_number, "error": str(e)})
+    return valid, rejected
+
+
+# Synthetic input with `invalid_rate` broken rows: bad separators, lengths, types, statuses and amounts
+def sample_rows(count, invalid_rate, seed):
+    rng = random.Random(seed)
+    users, accounts = [], []
+    for i in range(count):
+        broken = rng.random() < invalid_rate
+        users.append((rng.choice(["Olena Shevchenko", "Ivan Franko!", "J0hn Smith", "Anna-Maria Koval"])
+                      if not broken else rng.choice(["", "123", "One Two Three"]), '1990-01-01', ''))
+        prefix = f"ID--{rng.choice(['ab', 'abc', 'x'])}{rng.choice('#%_?&-')}"
+        width = ACCOUNT_NUMBER_LENGTH - len(prefix) - 1
+        number = f"{prefix}{i % 10 ** width:0{width}d}{rng.choice('#%_?&-')}"
+        account = [i, rng.choice(['credit', 'debit']), number, 1, 'USD', f"{rng.uniform(0, 1000):.2f}",
+                   rng.choice(['gold', 'silver', 'platinum'])]
+        if broken:
+            field = rng.randrange(4)
+            account[[2, 1, 6, 5][field]] = ["ID-bad", "loan", "bronze", "12,5"][field]
+        accounts.append(tuple(account))
+    return users, accounts
+
+
+# Validate in chunks the way bulk_insert does, best of `repeat` runs so one garbage collection pass does not
+# decide the comparison
+def best_time(validate, rows, chunk_size, repeat):
+    timings = []
+    for _ in range(repeat):
+        valid, rejected = [], []
+        started = time.perf_counter()
+        for offset in range(0, len(rows), chunk_size):
+            chunk_valid, chunk_rejected = validate(rows[offset:offset + chunk_size], offset + 1)
+            valid.extend(chunk_valid)
+            rejected.extend(chunk_rejected)
+        timings.append(time.perf_counter() - started)
+    return min(timings), valid, rejected
+
+
+def benchmark(count, invalid_rate, seed, chunk_size=BULK_CHUNK_SIZE, repeat=5):
+    users, accounts = sample_rows(count, invalid_rate, seed)
+    cases = [
+        ("users", users, lambda rows, start: legacy_validate_rows(rows, legacy_prepare_user, start), validate_users),
+        ("accounts", accounts, lambda rows, start: legacy_validate_rows(rows, legacy_prepare_account, start),
+         validate_accounts),
+    ]
+    for entity, rows, legacy, batch in cases:
+        legacy_elapsed, legacy_valid, legacy_rejected = best_time(legacy, rows, chunk_size, repeat)
+        batch_elapsed, valid, rejected = best_time(batch, rows, chunk_size, repeat)
+        same = valid == legacy_valid and [r["row"] for r in rejected] == [r["row"] for r in legacy_rejected]
+        print(f"{entity:>8}: legacy {count / legacy_elapsed:>12,.0f} rows/s, batch {count / batch_elapsed:>12,.0f} "
+              f"rows/s ({legacy_elapsed / batch_elapsed:.1f}x), {len(rejected)} rejected, "
+              f"{'same result' if same else 'RESULTS DIFFER'}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the batch validators against the per-row ones.")
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--invalid-rate', type=float, default=0.05)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunk-size', type=int, default=BULK_CHUNK_SIZE)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    benchmark(args.rows, args.invalid_rate, args.seed, args.chunk_size, args.repeat)
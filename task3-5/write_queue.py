@@ -0,0 +1,197 @@
+import os
+import time
+import queue
+import asyncio
+import sqlite3
+import logging
+import argparse
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from db_pool import ConnectionPool
+
+GROUP_MAX_SIZE = 500
+GROUP_MAX_WAIT = 0.005
+
+
+# The connection handed to operations: the group owns the transaction, so committing or rolling back from inside an
+# operation (the *_bulk loaders and archive_transactions do) fails that operation instead of ending the group early
+class OperationConnection:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def commit(self):
+        raise RuntimeError("Operations submitted to the write service cannot commit, the group commits them")
+
+    def rollback(self):
+        raise RuntimeError("Operations submitted to the write service cannot roll back, the group does it")
+
+
+# Single writer thread that drains submitted operations into group commits.
+# An operation is any db_connection function (or a plain function taking conn first). It runs inside a savepoint,
+# so a failing operation is rolled back alone. Work that must not happen under the write lock (an exchange rate
+# refresh) is declared as func.prepare_write(conn) and runs once per group before BEGIN IMMEDIATE.
+class WriteService:
+    def __init__(self, db_path, max_batch=GROUP_MAX_SIZE, max_wait=GROUP_MAX_WAIT, **pragmas):
+        self.pool = ConnectionPool(db_path, **pragmas)
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = queue.Queue()
+        self.stats = {"operations": 0, "groups": 0}
+        self.thread = threading.Thread(target=self.run, name="write-service", daemon=True)
+        self.thread.start()
+
+    def submit(self, func, *args, **kwargs):
+        future = Future()
+        self.queue.put((getattr(func, '__wrapped__', func), args, kwargs, future, None, prepare_step(func)))
+        return future
+
+    # Asyncio futures are resolved in one loop callback per group instead of one thread-safe wakeup per operation
+    async def submit_async(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.queue.put((getattr(func, '__wrapped__', func), args, kwargs, future, loop, prepare_step(func)))
+        return await future
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        self.pool.close_all()
+
+    def run(self):
+        conn = self.pool.acquire()
+        stopping = False
+        while not stopping:
+            item = self.queue.get()
+            if item is None:
+                break
+            group = [item]
+            deadline = time.monotonic() + self.max_wait
+            while len(group) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                try:
+                    item = self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                group.append(item)
+            self.commit_group(conn, group)
+
+    def prepare_group(self, conn, group):
+        for prepare in {item[5] for item in group if item[5]}:
+            try:
+                prepare(conn)
+            except Exception as e:
+                # The operations that needed it fail on their own inside the group
+                logging.warning(f"Preparing a write group failed: {e}")
+
+    def commit_group(self, conn, group):
+        self.prepare_group(conn, group)
+        operation_conn = OperationConnection(conn)
+        outcomes = []
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for func, args, kwargs, future, loop, _ in group:
+                if future.cancelled() or (loop is None and not future.set_running_or_notify_cancel()):
+                    continue
+                conn.execute('SAVEPOINT operation')
+                try:
+                    result = func(operation_conn, *args, **kwargs)
+                    error = None
+                except Exception as e:
+                    result, error = None, e
+                if error or (isinstance(result, dict) and result.get("status") == "failure"):
+                    conn.execute('ROLLBACK TO operation')
+                conn.execute('RELEASE operation')
+                outcomes.append((future, loop, result, error))
+            conn.commit()
+        except Exception as e:
+            logging.error(f"Group commit of {len(group)} operations failed: {e}")
+            if conn.in_transaction:
+                conn.rollback()
+            self.publish([(future, loop, None, e) for _, _, _, future, loop, _ in group])
+            return
+
+        self.stats["operations"] += len(outcomes)
+        self.stats["groups"] += 1
+        # Results are published only after the group is durable
+        self.publish(outcomes)
+
+    def publish(self, outcomes):
+        by_loop = {}
+        for future, loop, result, error in outcomes:
+            if loop is None:
+                if not future.done():
+                    set_outcome(future, result, error)
+            else:
+                by_loop.setdefault(loop, []).append((future, result, error))
+        for loop, loop_outcomes in by_loop.items():
+            loop.call_soon_threadsafe(set_outcomes, loop_outcomes)
+
+
+def prepare_step(func):
+    return getattr(func, 'prepare_write', None)
+
+
+def set_outcome(future, result, error):
+    if error:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+def set_outcomes(outcomes):
+    for future, result, error in outcomes:
+        if not future.done():
+            set_outcome(future, result, error)
+
+
+# Throughput of concurrent add_user calls: per-call commits vs the write service
+def benchmark(db_path, operations, writers, pragmas):
+    import task3
+    import task4
+
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    conn = sqlite3.connect(db_path)
+    task3.create_tables(conn.cursor(), False)
+    conn.commit()
+    conn.close()
+
+    users = [("Bench User", '1990-01-01', 'bench') for _ in range(operations)]
+
+    task4.configure_db(db_path, **pragmas)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=writers) as executor:
+        results = list(executor.map(lambda user: task4.add_user(*user), users))
+    per_call = time.perf_counter() - started
+    failed = sum(1 for result in results if result["status"] != "success")
+    print(f"per-call commits: {operations / per_call:,.0f} ops/s with {writers} writer threads ({failed} failed)")
+
+    service = WriteService(db_path, **pragmas)
+
+    async def submit_all():
+        return await asyncio.gather(*(service.submit_async(task4.add_user, *user) for user in users))
+
+    started = time.perf_counter()
+    results = asyncio.run(submit_all())
+    grouped = time.perf_counter() - started
+    service.close()
+    failed = sum(1 for result in results if result["status"] != "success")
+    print(f"group commits:    {operations / grouped:,.0f} ops/s in {service.stats['groups']} groups ({failed} failed)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the single-writer group commit service.")
+    parser.add_argument('--db', default='write_queue_bench.db', help='Scratch database file (recreated on every run)')
+    parser.add_argument('--operations', type=int, default=20000)
+    parser.add_argument('--writers', type=int, default=8, help='Threads issuing per-call commits')
+    parser.add_argument('--pragma', action='append', default=[], metavar='NAME=VALUE',
+                        help='Override a connection pragma, e.g. --pragma synchronous=FULL')
+    args = parser.parse_args()
+    benchmark(args.db, args.operations, args.writers, dict(pragma.split('=', 1) for pragma in args.pragma))